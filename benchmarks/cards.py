@@ -0,0 +1,270 @@
+"""Benchmark each stage of the card pipeline, per card type, without any HTTP request.
+
+The aidedd cards are built from the fixture pages, and the english spells from
+the bundled data/spells.json. For each card type, the stages are timed:
+- parse: HTML parsing, in BaseAideDDScraper.parse_page
+- scrape: building the model from the parsed page, in the scraper scrape()
+- to_card: formatting the model as card data, in its to_card()
+- json: writing the card to the output, as in cli.main
+
+Usage: python benchmarks/cards.py [--repeat N] [--spells N] [--output results.json]
+           [--compare previous.json]
+
+The results, throughput in cards/s along with the median latency and the peak
+memory of each stage, can be written to a JSON file, and compared with a
+previous run.
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dnd5e_card_generator import export  # noqa: E402,F401
+from dnd5e_card_generator.config import Config  # noqa: E402
+from dnd5e_card_generator.const import FIVE_E_SHEETS_SPELLS  # noqa: E402
+from dnd5e_card_generator.export.writers import JSONArrayWriter  # noqa: E402
+from dnd5e_card_generator.scraping.aidedd import (  # noqa: E402
+    AncestryFeatureScraper,
+    BackgroundScraper,
+    CharacterClassFeatureScraper,
+    EldrichInvocationScraper,
+    FeatScraper,
+    MagicItemScraper,
+    SpellScraper,
+)
+from dnd5e_card_generator.scraping.five_e_sheets import (  # noqa: E402
+    FiveESheetsSpellScraper,
+)
+from dnd5e_card_generator.scraping.page import lxml_available  # noqa: E402
+from dnd5e_card_generator.utils import slugify  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+STAGES = ["parse", "scrape", "to_card", "json"]
+
+
+@dataclass
+class Case:
+    card_type: str
+    # Return new scrapers, with their page injected
+    scrapers: Callable[[], list[Any]]
+
+
+def from_fixture(fixture: str, make_scraper: Callable[[], Any]) -> Callable[[], list]:
+    html = (FIXTURES_DIR / fixture).read_text()
+
+    def scrapers() -> list:
+        scraper = make_scraper()
+        scraper.html = html
+        return [scraper]
+
+    return scrapers
+
+
+def cases(spell_count: int | None) -> list[Case]:
+    slugs = [slugify(title) for title in FIVE_E_SHEETS_SPELLS][:spell_count]
+    return [
+        Case(
+            "spell",
+            from_fixture(
+                "spell_fr.html", lambda: SpellScraper(slug="boule-de-feu", lang="fr")
+            ),
+        ),
+        Case(
+            "magic_item",
+            from_fixture(
+                "item_fr.html",
+                lambda: MagicItemScraper(slug="anneau-de-regeneration", lang="fr"),
+            ),
+        ),
+        Case(
+            "feat",
+            from_fixture(
+                "feat_fr.html", lambda: FeatScraper(slug="sentinelle", lang="fr")
+            ),
+        ),
+        # Eldritch invocation pages have the same layout as the feat pages
+        Case(
+            "eldricht_invocation",
+            from_fixture(
+                "feat_fr.html",
+                lambda: EldrichInvocationScraper(slug="sentinelle", lang="fr"),
+            ),
+        ),
+        Case(
+            "class_feature",
+            from_fixture(
+                "class_fr.html",
+                lambda: CharacterClassFeatureScraper(
+                    class_name="clerc", title="Conduit divin", lang="fr"
+                ),
+            ),
+        ),
+        Case(
+            "ancestry_feature",
+            from_fixture(
+                "ancestry_fr.html",
+                lambda: AncestryFeatureScraper(
+                    ancestry="nain", sub_ancestry="", lang="fr"
+                ),
+            ),
+        ),
+        Case(
+            "background",
+            from_fixture(
+                "background_fr.html",
+                lambda: BackgroundScraper(slug="acolyte", lang="fr"),
+            ),
+        ),
+        Case(
+            "spell (5e-sheets)",
+            lambda: [FiveESheetsSpellScraper(slug=slug, lang="en") for slug in slugs],
+        ),
+    ]
+
+
+def run_stages(scraper, writer: JSONArrayWriter, measure: Callable) -> None:
+    """Run every stage of the pipeline on the scraper, each within `measure`"""
+    if not scraper.offline:
+        with measure("parse"):
+            scraper.page
+    with measure("scrape"):
+        model = scraper.scrape()
+    with measure("to_card"):
+        card = model.to_card()
+    with measure("json"):
+        writer.write(card)
+
+
+def benchmark(case: Case, repeat: int) -> dict:
+    timings: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    peaks: dict[str, int] = {stage: 0 for stage in STAGES}
+
+    @contextlib.contextmanager
+    def timed(stage: str):
+        start = time.perf_counter()
+        yield
+        timings[stage].append(time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def traced(stage: str):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        yield
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[stage] = max(peaks[stage], peak - current)
+
+    cards = 0
+    start = time.perf_counter()
+    # The scrapers report their progress on stderr
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        for _ in range(repeat):
+            writer = JSONArrayWriter(io.StringIO())
+            for scraper in case.scrapers():
+                run_stages(scraper, writer, timed)
+                cards += 1
+        duration = time.perf_counter() - start
+
+        # Memory is measured apart, as tracing slows the allocations down
+        tracemalloc.start()
+        writer = JSONArrayWriter(io.StringIO())
+        for scraper in case.scrapers():
+            run_stages(scraper, writer, traced)
+        tracemalloc.stop()
+
+    return {
+        "card_type": case.card_type,
+        "cards": cards,
+        "cards_per_second": cards / duration,
+        "stages": {
+            stage: {
+                "median_ms": statistics.median(timings[stage]) * 1000,
+                "peak_kib": peaks[stage] / 1024,
+            }
+            for stage in STAGES
+            if timings[stage]
+        },
+    }
+
+
+def print_results(results: list[dict], previous: dict[str, dict]):
+    print(
+        f"{'card type':<22}{'cards/s':>10}"
+        + "".join(f"{stage + ' (ms)':>14}" for stage in STAGES)
+        + f"{'peak (KiB)':>12}"
+        + (f"{'vs previous':>13}" if previous else "")
+    )
+    for result in results:
+        stages = result["stages"]
+        line = f"{result['card_type']:<22}{result['cards_per_second']:>10.1f}"
+        for stage in STAGES:
+            median = f"{stages[stage]['median_ms']:.3f}" if stage in stages else "-"
+            line += f"{median:>14}"
+        line += f"{max(s['peak_kib'] for s in stages.values()):>12.0f}"
+        if baseline := previous.get(result["card_type"]):
+            ratio = result["cards_per_second"] / baseline["cards_per_second"]
+            line += f"{ratio - 1:>+13.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--spells",
+        type=int,
+        help="Number of spells of data/spells.json to build (default: all)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, help="File to write the results to"
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="Results of a previous run to compare with"
+    )
+    args = parser.parse_args()
+
+    results = []
+    for case in cases(args.spells):
+        # Each 5e-sheets repetition builds every spell
+        repeat = 1 if case.card_type == "spell (5e-sheets)" else args.repeat
+        results.append(benchmark(case, repeat))
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {r["card_type"]: r for r in json.load(f)["results"]}
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "created_at": time.time(),
+                    "python": platform.python_version(),
+                    "html_parser": (
+                        "lxml"
+                        if Config.HTML_PARSER == "auto" and lxml_available()
+                        else Config.HTML_PARSER
+                    ),
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
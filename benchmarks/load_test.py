@@ -0,0 +1,188 @@
+"""Load-test the page fetch path against the local stub server, for several
+worker counts, engines and server latency distributions.
+
+Usage: python benchmarks/load_test.py [--jobs 1 5 20] [--engine threads asyncio]
+           [--latency const:0.05 lognormal:0.05:1] [--error-rate 0.01]
+           [--max-connections 10] [--pages 200] [--json results.json]
+
+Each configuration fetches the same pages, cycling through every URL shape of
+const.py, from a fresh process so that the session, connection pool and
+request policy are sized after its worker count. The throughput, and the
+median and 99th percentile of the page latencies are reported per
+configuration.
+
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from stub_server import LatencyDistribution, serve  # noqa: E402
+
+
+def percentile(values: list[float], percentile: float) -> float:
+    values = sorted(values)
+    rank = math.ceil(percentile / 100 * len(values)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def pages(count: int) -> list[tuple[str, dict]]:
+    """Return `count` distinct pages, cycling through the URL shapes of const.py"""
+    from dnd5e_card_generator import const
+
+    shapes = [
+        lambda i: (const.AIDEDD_SPELLS_URL, {"vf": f"sort-{i}"}),
+        lambda i: (const.AIDEDD_MAGIC_ITEMS_URL, {"vf": f"objet-{i}"}),
+        lambda i: (const.AIDEDD_FEATS_ITEMS_URL, {"vf": f"don-{i}"}),
+        lambda i: (const.AIDEDD_ELDRICHT_INVOCATIONS_URL, {"vf": f"invocation-{i}"}),
+        lambda i: (const.AIDEDD_CLASS_RULES_URL["fr"].format(class_=f"classe-{i}"), {}),
+        lambda i: (const.AIDEDD_CLASS_RULES_URL["en"].format(class_=f"class-{i}"), {}),
+        lambda i: (const.AIDEDD_UNEARTHED_ARCANA_URL.format(class_=f"class-{i}"), {}),
+        lambda i: (const.AIDEDD_RACE_RULES_URL["fr"].format(ancestry=f"race-{i}"), {}),
+        lambda i: (const.AIDEDD_BACKGROUND_URL["fr"].format(background=f"bg-{i}"), {}),
+    ]
+    return [shapes[i % len(shapes)](i) for i in range(count)]
+
+
+def run_configuration(engine: str, jobs: int, page_count: int) -> dict:
+    """Fetch the pages from the stub server, and return the measured latencies"""
+    from dnd5e_card_generator.config import Config
+
+    with tempfile.TemporaryDirectory(prefix="dnd5e-load-test-") as cache_dir:
+        Config.CACHE_DIR = Path(cache_dir)
+        Config.BYPASS_CACHE = True
+        Config.MAX_WORKERS = jobs
+
+        from dnd5e_card_generator.scraping.fetch import fetch_page
+
+        def timed(fetch):
+            def timed_fetch(page: tuple[str, dict]) -> float | None:
+                start = time.perf_counter()
+                try:
+                    fetch(*page)
+                except Exception:
+                    return None
+                return time.perf_counter() - start
+
+            return timed_fetch
+
+        start = time.perf_counter()
+        if engine == "threads":
+            with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+                latencies = list(executor.map(timed(fetch_page), pages(page_count)))
+        else:
+            from dnd5e_card_generator.scraping.async_engine import AsyncScrapingEngine
+
+            async def fetch_all() -> list[float | None]:
+                # Pages are timed once in flight, as with the thread pool
+                in_flight = asyncio.Semaphore(jobs)
+                async with AsyncScrapingEngine(concurrency=jobs) as engine:
+
+                    async def timed_download(page: tuple[str, dict]) -> float | None:
+                        async with in_flight:
+                            start = time.perf_counter()
+                            try:
+                                await engine.download(*page)
+                            except Exception:
+                                return None
+                            return time.perf_counter() - start
+
+                    return await asyncio.gather(
+                        *(timed_download(page) for page in pages(page_count))
+                    )
+
+            latencies = asyncio.run(fetch_all())
+        duration = time.perf_counter() - start
+    succeeded = [latency for latency in latencies if latency is not None]
+    return {
+        "duration": duration,
+        "pages": len(succeeded),
+        "failures": len(latencies) - len(succeeded),
+        "pages_per_second": len(succeeded) / duration,
+        "p50": percentile(succeeded, 50) if succeeded else None,
+        "p99": percentile(succeeded, 99) if succeeded else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument(
+        "--engine", choices=["threads", "asyncio"], nargs="+", default=["threads"]
+    )
+    parser.add_argument(
+        "--latency",
+        type=LatencyDistribution,
+        nargs="+",
+        default=[LatencyDistribution("const:0.05")],
+        help="Latency distributions of the stub server (see stub_server.py)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of the requests failing with a 503 (default: 0)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="Number of requests the stub server handles concurrently (default: no limit)",
+    )
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--json", type=Path, help="File to write the results to")
+    args = parser.parse_args()
+
+    server = serve(error_rate=args.error_rate, max_connections=args.max_connections)
+    # Inherited by the processes running each configuration
+    os.environ["AIDEDD_BASE_URL"] = server.base_url
+    context = multiprocessing.get_context("spawn")
+
+    results = []
+    print(
+        f"{'engine':<9}{'jobs':>5}  {'latency':<20}{'pages/s':>9}{'p50 (ms)':>10}"
+        f"{'p99 (ms)':>10}{'failed':>8}{'requests':>10}"
+    )
+    for engine, jobs, latency in itertools.product(
+        args.engine, args.jobs, args.latency
+    ):
+        server.configure(latency, args.error_rate, args.max_connections)
+        with context.Pool(1) as pool:
+            result = pool.apply(run_configuration, (engine, jobs, args.pages))
+        result.update(
+            engine=engine,
+            jobs=jobs,
+            latency=str(latency),
+            error_rate=args.error_rate,
+            max_connections=args.max_connections,
+            server_requests=server.requests,
+            server_errors=server.errors,
+        )
+        results.append(result)
+        p50, p99 = (
+            f"{result[p] * 1000:.1f}" if result[p] is not None else "-"
+            for p in ("p50", "p99")
+        )
+        print(
+            f"{engine:<9}{jobs:>5}  {str(latency):<20}"
+            f"{result['pages_per_second']:>9.1f}{p50:>10}{p99:>10}"
+            f"{result['failures']:>8}{server.requests:>10}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare the parse time and memory of the BeautifulSoup backends, with and without
+partial parsing, on a spell page and on a full class rules page.
+
+Usage: python benchmarks/parsing.py [--repeat N]
+
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dnd5e_card_generator.config import Config  # noqa: E402
+from dnd5e_card_generator.scraping.page import lxml_available, parse_html  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+PAGES = ["spell_fr.html", "class_fr.html"]
+
+
+def measure(html: str, parser: str, partial: bool, repeat: int) -> tuple[float, int]:
+    """Return the median parse time in ms and the peak memory allocated while parsing"""
+    Config.HTML_PARSER = parser
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_html(html, partial=partial)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    soup = parse_html(html, partial=partial)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del soup
+    return statistics.median(timings) * 1000, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    backends = ["html.parser"] + (["lxml"] if lxml_available() else [])
+    print(
+        f"{'page':<16}{'backend':<14}{'partial':<10}{'time (ms)':>10}{'peak (KiB)':>12}"
+    )
+    for page in PAGES:
+        html = (FIXTURES_DIR / page).read_text()
+        for backend in backends:
+            for partial in (False, True):
+                duration, peak = measure(html, backend, partial, args.repeat)
+                print(
+                    f"{page:<16}{backend:<14}{str(partial):<10}"
+                    f"{duration:>10.2f}{peak / 1024:>12.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Local stand-in for aidedd, serving the fixture pages at every URL of const.py.
+
+Each page is served after a latency drawn from a distribution, a fraction of
+the requests fail with a 503, and the number of requests handled concurrently
+can be limited, the others waiting for a free slot as in a server backlog.
+
+Usage: python benchmarks/stub_server.py [--port 8000] [--latency exp:0.05]
+           [--error-rate 0.01] [--max-connections 10]
+
+The scrapers are pointed at the server with the AIDEDD_BASE_URL environment
+variable:
+
+    AIDEDD_BASE_URL=http://127.0.0.1:8000 dnd5e-card-generator --bypass-cache ...
+
+Latency distributions, in seconds:
+- const:S              always S
+- uniform:A:B          uniformly between A and B
+- exp:MEAN             exponential, with the given mean
+- lognormal:MEDIAN:SIGMA  log-normal, a long tail for a large sigma
+
+"""
+
+import argparse
+import hashlib
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dnd5e_card_generator import const  # noqa: E402
+from dnd5e_card_generator.scraping.crawler import canonical_page  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+# Fixture served for each kind of page (see crawler.canonical_page). Eldritch
+# invocations have the same layout as feats.
+FIXTURES = {
+    "spell": "spell_fr.html",
+    "magic_item": "item_fr.html",
+    "feat": "feat_fr.html",
+    "eldricht_invocation": "feat_fr.html",
+    "class": "class_fr.html",
+    "ancestry": "ancestry_fr.html",
+    "background": "background_fr.html",
+}
+# Number of spells of each level known to the spell filter
+FILTER_TABLE_SIZE = 20
+
+
+class LatencyDistribution:
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        params = [float(arg) for arg in args.split(":")] if args else []
+        samplers = {
+            "const": lambda s: s,
+            "uniform": random.uniform,
+            "exp": lambda mean: random.expovariate(1 / mean) if mean else 0.0,
+            "lognormal": lambda median, sigma: random.lognormvariate(
+                math.log(median), sigma
+            ),
+        }
+        if kind not in samplers:
+            raise ValueError(f"unknown latency distribution {kind!r}")
+        self.sampler = samplers[kind]
+        self.params = params
+        # Fail now rather than in the server threads
+        self.sample()
+
+    def sample(self) -> float:
+        return max(self.sampler(*self.params), 0.0)
+
+    def __str__(self) -> str:
+        return self.spec
+
+
+def spell_in_class(slug: str, class_code: str) -> bool:
+    """Return whether the spell is on the spell list of the class, about one in two"""
+    return hashlib.sha256(f"{slug}:{class_code}".encode()).digest()[0] < 128
+
+
+def spell_filter_table(body: str) -> str:
+    """Return a spell table as returned by the aidedd spell filter, for the filter.
+
+    The server knows FILTER_TABLE_SIZE spells per level, each on the spell list
+    of some classes: as on aidedd, the tables of overlapping filters (such as
+    all the classes at one level, and one class at all levels) list the same
+    spells.
+
+    """
+    query = parse_qs(body)
+    class_codes = query.get("Filtre1[]", [])
+    min_level = int(query.get("nivMin", ["0"])[0])
+    max_level = int(query.get("nivMax", ["9"])[0])
+    rows = []
+    for level in range(min_level, max_level + 1):
+        for i in range(FILTER_TABLE_SIZE):
+            slug = f"sort-{level}-{i}"
+            if any(spell_in_class(slug, code) for code in class_codes):
+                rows.append(
+                    f'<tr><td><a href="../dnd/sorts.php?vf={slug}">Sort {level}-{i}</a>'
+                    f'</td><td>{level}</td><td class="colVO">Spell {level}-{i}</td></tr>'
+                )
+    return f"<html><body><table><tr><th>Nom</th><th>Niv</th><th>VO</th></tr>{''.join(rows)}</table></body></html>"
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        latency: LatencyDistribution,
+        error_rate: float = 0.0,
+        max_connections: int | None = None,
+    ):
+        super().__init__(address, StubRequestHandler)
+        self.pages = {
+            kind: (FIXTURES_DIR / fixture).read_bytes()
+            for kind, fixture in FIXTURES.items()
+        }
+        self.configure(latency, error_rate, max_connections)
+
+    def configure(
+        self,
+        latency: LatencyDistribution,
+        error_rate: float = 0.0,
+        max_connections: int | None = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_connections = max_connections
+        self.slots = threading.BoundedSemaphore(max_connections or sys.maxsize)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients closing their connections, such as the losers of hedged requests
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately: with Nagle's algorithm, the
+    # body would wait for the delayed ACK of the headers on keep-alive connections
+    disable_nagle_algorithm = True
+    server: StubServer
+
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        page = canonical_page(self.path, const.AIDEDD_BASE_URL + "/")
+        self.respond(self.server.pages[page.kind] if page else None)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlsplit(self.path).path == urlsplit(const.AIDEDD_SPELLS_FILTER_URL).path:
+            self.respond(spell_filter_table(body.decode()).encode())
+        else:
+            self.respond(None)
+
+    def respond(self, page: bytes | None):
+        server = self.server
+        with server.slots:
+            time.sleep(server.latency.sample())
+            with server.lock:
+                server.requests += 1
+                failed = random.random() < server.error_rate
+                server.errors += failed
+            if failed:
+                status, body = 503, b"Service Unavailable"
+            elif page is None:
+                status, body = 404, b"Not Found"
+            else:
+                status, body = 200, page
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: LatencyDistribution | None = None,
+    error_rate: float = 0.0,
+    max_connections: int | None = None,
+) -> StubServer:
+    """Start the stub server in a background thread, and return it"""
+    server = StubServer(
+        (host, port),
+        latency=latency or LatencyDistribution("const:0"),
+        error_rate=error_rate,
+        max_connections=max_connections,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency",
+        type=LatencyDistribution,
+        default=LatencyDistribution("const:0.05"),
+        help="Latency distribution of the responses (default: const:0.05)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of the requests failing with a 503 (default: 0)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="Number of requests handled concurrently (default: no limit)",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        max_connections=args.max_connections,
+    )
+    print(f"Serving the aidedd fixtures on {server.base_url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Check the text fragments extracted from the benchmark fixtures against the
+expected fragments stored in fixtures/text_golden.json.
+
+The expected fragments were produced by the sanitize_soup implementation the
+TextExtractor replaced, and are checked with every available parser backend.
+The cases of CASES check the intended differences with sanitize_soup.
+
+Usage: python benchmarks/text_golden.py [--update]
+
+"""
+
+import argparse
+import difflib
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dnd5e_card_generator.config import Config  # noqa: E402
+from dnd5e_card_generator.scraping.page import lxml_available, parse_html  # noqa: E402
+from dnd5e_card_generator.scraping.text import TextExtractor  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+GOLDEN_PATH = FIXTURES_DIR / "text_golden.json"
+
+# tags_to_unwrap_from_description of the aidedd scrapers
+UNWRAPPED_TAGS = [["a", "em", "ul", "li", "strong"], ["em", "a"]]
+
+# (html, unwrapped tags, expected fragments). sanitize_soup rendered an em or
+# strong tag with several children as _None_ or *None*: the first two cases
+# used to give "Une _None_ et *None*." and "Une _None_ et ".
+CASES = [
+    (
+        "<p>Une <em>arme <a href='#'>magique</a></em> et <strong>deux "
+        "<em>mots</em></strong>.</p>",
+        ["a", "em", "ul", "li", "strong"],
+        ["Une _arme magique_ et *deux _mots_*."],
+    ),
+    (
+        "<p>Une <em>arme <a href='#'>magique</a></em> et <strong>deux "
+        "<em>mots</em></strong>.</p>",
+        ["em", "a"],
+        ["Une _arme magique_ et ", "deux _mots_", "."],
+    ),
+    (
+        "<ul><li>un <strong>bonus</strong> de +1</li><li><em>deux</em> fois</li></ul>",
+        ["a", "em", "ul", "li", "strong"],
+        ["• un bonus de +1", "• _deux_ fois"],
+    ),
+]
+
+
+def extract_fixture(path: Path) -> dict[str, list[list[str]]]:
+    """Return the fragments of each block of the page content, per unwrapped tags"""
+    soup = parse_html(path.read_text(), partial=True)
+    content = soup.find("div", class_="col1") or soup.find("div", class_="content")
+    blocks = [tag for tag in content.find_all(recursive=False) if tag.name != "table"]
+    return {
+        ",".join(tags): [TextExtractor(tags).extract(block) for block in blocks]
+        for tags in UNWRAPPED_TAGS
+    }
+
+
+def extract_fixtures() -> dict[str, dict[str, list[list[str]]]]:
+    return {
+        path.name: extract_fixture(path) for path in sorted(FIXTURES_DIR.glob("*.html"))
+    }
+
+
+def diff(expected, actual) -> str:
+    return "\n".join(
+        difflib.unified_diff(
+            json.dumps(expected, indent=1, ensure_ascii=False).splitlines(),
+            json.dumps(actual, indent=1, ensure_ascii=False).splitlines(),
+            "expected",
+            "actual",
+            lineterm="",
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help=f"Overwrite {GOLDEN_PATH.name} with the current fragments",
+    )
+    args = parser.parse_args()
+
+    if args.update:
+        Config.HTML_PARSER = "html.parser"
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump(extract_fixtures(), f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        print(f"{GOLDEN_PATH} updated")
+        return
+
+    golden = json.loads(GOLDEN_PATH.read_text())
+    failures = 0
+    for backend in ["html.parser"] + (["lxml"] if lxml_available() else []):
+        Config.HTML_PARSER = backend
+        for page, expected in golden.items():
+            actual = extract_fixture(FIXTURES_DIR / page)
+            if actual != expected:
+                failures += 1
+                print(f"FAIL {page} ({backend})\n{diff(expected, actual)}")
+            else:
+                print(f"ok   {page} ({backend})")
+        for html, tags, expected in CASES:
+            block = parse_html(html).find(["p", "ul"])
+            actual = TextExtractor(tags).extract(block)
+            if actual != expected:
+                failures += 1
+                print(f"FAIL {html} ({backend})\n{diff(expected, actual)}")
+            else:
+                print(f"ok   {html[:40]}... ({backend})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
+import asyncio
+import os
 import sys
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 from .color import generate_palette
 from .config import Config
-from .export import (
-    export_ancestry_features_to_cards,
-    export_backgrounds_to_cards,
-    export_class_features_to_cards,
-    export_eldricht_invocations_to_cards,
-    export_feats_to_cards,
-    export_items_to_cards,
-    export_spells_to_cards,
-)
+from .export import aexport_cards, iter_cards
+from .export.writers import WRITERS
 from .models import (
     CliAncestryFeature,
     CliBackground,
@@ -26,7 +22,19 @@ from .models import (
     CliSpell,
     CliSpellFilter,
 )
+from .metrics import RUN_DURATION, RUN_SUCCESS, get_metrics
+from .profiling import enable_profiling, get_profiler
 from .scraping.aidedd import SpellFilter
+from .scraping.archive import (
+    add_http_archive_arguments,
+    configure_http_archive,
+    get_http_archive,
+)
+from .scraping.async_engine import aiohttp_available
+from .scraping.hedging import get_hedger
+from .scraping.session import connection_stats
+from .scraping.snapshot import LATEST, SnapshotNotFound, get_snapshot
+from .scraping.spell_catalogue import get_spell_catalogue
 
 
 def parse_args():
@@ -57,11 +65,15 @@ def parse_args():
     )
     parser.add_argument(
         "--spell-filter",
+        nargs="+",
         help=(
-            "Filter resolved to a list of spells, of form <lang>:<class>:<start-lvl>:<end-level>.\n"
-            "Example: fr:clerc:0:1"
+            "Space separated filters resolved to a list of spells, of form\n"
+            "<lang>:<class>:<start-lvl>:<end-level>. Spells matching any filter are included.\n"
+            "Filters are resolved from a spell catalogue built once and stored in --cache-dir.\n"
+            "Example: fr:clerc:0:1 fr:paladin:1:2"
         ),
         required=False,
+        default=[],
         type=CliSpellFilter.from_str,
     )
     parser.add_argument(
@@ -71,6 +83,16 @@ def parse_args():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "--spell-source",
+        choices=["aidedd", "5esheets"],
+        help=(
+            "Source of the english spells. 5esheets builds them from the bundled 5e-sheets\n"
+            "dataset, without any HTTP request. French spells are always scraped from aidedd.\n"
+            "(default: aidedd)"
+        ),
+        default=Config.SPELL_SOURCE,
+    )
     parser.add_argument(
         "--items",
         nargs="+",
@@ -136,22 +158,302 @@ def parse_args():
         help="Bypass local cache to force the scrapers to issue HTTP requests (default: False)",
         default=False,
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help=f"Directory in which the scraped pages are cached (default: {Config.CACHE_DIR})",
+        default=Config.CACHE_DIR,
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        help=(
+            "Number of days after which a cached page is revalidated with aidedd.org "
+            f"(default: {Config.CACHE_TTL / 86400:g})"
+        ),
+        default=Config.CACHE_TTL / 86400,
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        help=(
+            "Size budget of the page cache in MB. The least recently used pages are "
+            f"evicted past this size (default: {Config.CACHE_MAX_SIZE // 1024**2})"
+        ),
+        default=Config.CACHE_MAX_SIZE // 1024**2,
+    )
+    parser.add_argument(
+        "--snapshot",
+        nargs="?",
+        const=LATEST,
+        help=(
+            "Read the pages from a local snapshot of aidedd, written by crawl-aidedd, instead\n"
+            "of fetching them. Takes the version of the snapshot (default: the latest one)"
+        ),
+        default=Config.SNAPSHOT,
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help=(
+            "With --snapshot, fail on the pages missing from the snapshot instead of\n"
+            "fetching them from aidedd"
+        ),
+        default=Config.SNAPSHOT_OFFLINE,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help=(
+            "Number of pages scraped concurrently, also used as the size of the HTTP "
+            f"connection pool (default: {Config.MAX_WORKERS})"
+        ),
+        default=Config.MAX_WORKERS,
+    )
+    parser.add_argument(
+        "--jobs-per-host",
+        type=int,
+        help="Maximum number of pages fetched concurrently from the same host (default: --jobs)",
+        default=Config.MAX_WORKERS_PER_HOST,
+    )
+    parser.add_argument(
+        "--parse-jobs",
+        type=int,
+        help=(
+            "Number of processes parsing the fetched pages into cards. 1 parses them in\n"
+            f"the main process (default: number of CPUs, {Config.PARSE_WORKERS})"
+        ),
+        default=Config.PARSE_WORKERS,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help=(
+            "Average number of requests per second sent to the same host. The number of\n"
+            "requests in flight is also reduced when the host starts failing (default: no limit)"
+        ),
+        default=Config.MAX_REQUESTS_PER_SECOND,
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help=(
+            "Number of retries of the requests failing with 429/5xx or a connection error,\n"
+            f"with an exponential backoff (default: {Config.HTTP_RETRIES})"
+        ),
+        default=Config.HTTP_RETRIES,
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        help=(
+            "Send a request again when it is slower than this percentile of the latency\n"
+            "of the recent requests, and keep the first response. Ex: 95 (default: disabled)"
+        ),
+        default=Config.HEDGE_PERCENTILE,
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=float,
+        help=(
+            "Maximum number of hedged requests, as a fraction of the requests sent\n"
+            f"(default: {Config.HEDGE_BUDGET})"
+        ),
+        default=Config.HEDGE_BUDGET,
+    )
+    add_http_archive_arguments(parser)
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        help=(
+            "Engine used to fetch the pages. The asyncio engine keeps up to --jobs requests\n"
+            "in flight without using one thread per request, and requires aiohttp\n"
+            "(default: threads)"
+        ),
+        default="threads",
+    )
+    parser.add_argument(
+        "--html-parser",
+        choices=["auto", "lxml", "html.parser"],
+        help="BeautifulSoup parser backend. auto uses lxml when installed (default: auto)",
+        default=Config.HTML_PARSER,
+    )
+    parser.add_argument(
+        "--http-stats",
+        action="store_true",
+        help="Print HTTP connection reuse statistics on stderr at the end of the run",
+        default=False,
+    )
+    profile_group = parser.add_mutually_exclusive_group()
+    profile_group.add_argument(
+        "--profile",
+        type=Path,
+        metavar="REPORT",
+        help=(
+            "Write the wall and CPU time spent in each stage (network, cache, parsing,\n"
+            "text extraction, rendering, serialization), per card type and per item, to\n"
+            "the report file. The pages are then parsed in the main process"
+        ),
+    )
+    profile_group.add_argument(
+        "--memory-profile",
+        type=Path,
+        metavar="REPORT",
+        help=(
+            "Trace the allocations, and write the allocation sites holding the most memory\n"
+            "at the end of the fetch, parse, scrape, render and serialize stages, along\n"
+            "with the peak RSS, per card type, to the report file. Much slower; the pages\n"
+            "are then parsed in the main process"
+        ),
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=["json", "folded"],
+        help=(
+            "Format of the profile report. folded is the folded stacks format read by\n"
+            "flamegraph.pl and speedscope, weighted by wall time, or by allocated bytes\n"
+            "for --memory-profile (default: json)"
+        ),
+        default="json",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        metavar="FILE",
+        help=(
+            "Write the metrics of the run (page cache hits and misses, bytes downloaded,\n"
+            "retries, request latency per host, cards exported per type and scraping\n"
+            "failures) to the file, even if the run fails"
+        ),
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["prometheus", "json"],
+        help=(
+            "Format of the metrics file. prometheus is the text format read by the node\n"
+            "exporter textfile collector (default: prometheus)"
+        ),
+        default="prometheus",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=list(WRITERS),
+        help=(
+            "json writes a JSON array of cards, as read by rpg-cards. ndjson writes one card\n"
+            "per line. In both cases, cards are written as soon as they are exported\n"
+            "(default: json)"
+        ),
+        default="json",
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help=(
+            "Write each card as soon as it is scraped, instead of sorting the cards of\n"
+            "each category (threads engine only)"
+        ),
+        default=False,
+    )
     parser.add_argument(
         "-o",
         "--output",
         type=Path,
         help="File to write the card data to",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.engine == "asyncio" and not aiohttp_available():
+        parser.error("the asyncio engine requires aiohttp to be installed")
+    if args.offline and args.snapshot is None:
+        parser.error("--offline requires --snapshot")
+    if args.engine == "asyncio" and args.unordered:
+        parser.error("--unordered is only supported by the threads engine")
+    return args
+
+
+@contextmanager
+def open_output(path: Path | None):
+    """Open the file the cards are written to, or stdout when path is None
+
+    The cards are written to a temporary file next to path, only replacing path
+    once every card was written, so that a failed run leaves the previous output
+    untouched instead of a truncated deck.
+
+    """
+    if path is None:
+        yield sys.stdout
+        return
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    # Opened before the try block, so that a temporary file this run didn't
+    # create is never removed
+    f = open(tmp_path, "x")
+    try:
+        with f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_metrics(path: Path, format: str):
+    with open(path, "w") as f:
+        if format == "json":
+            get_metrics().write_json(f)
+        else:
+            get_metrics().write_prometheus(f)
 
 
 def main():
     args = parse_args()
-    cards, spells = [], []
+    start = time.monotonic()
+    try:
+        run(args)
+    except BaseException:
+        RUN_SUCCESS.set(0)
+        raise
+    else:
+        RUN_SUCCESS.set(1)
+    finally:
+        RUN_DURATION.set(time.monotonic() - start)
+        if args.metrics:
+            write_metrics(args.metrics, args.metrics_format)
+
+
+def run(args):
+    spells = []
 
     if args.bypass_cache:
         Config.BYPASS_CACHE = True
 
+    Config.CACHE_DIR = args.cache_dir
+    Config.CACHE_TTL = args.cache_ttl * 86400
+    Config.CACHE_MAX_SIZE = args.cache_max_size * 1024**2
+    Config.MAX_WORKERS = args.jobs
+    Config.MAX_WORKERS_PER_HOST = args.jobs_per_host
+    Config.PARSE_WORKERS = args.parse_jobs
+    if args.profile or args.memory_profile:
+        enable_profiling(memory=bool(args.memory_profile))
+        # Stages run in parse worker processes would escape the profiler
+        Config.PARSE_WORKERS = 1
+    Config.MAX_REQUESTS_PER_SECOND = args.rate_limit
+    Config.HTTP_RETRIES = args.retries
+    Config.HEDGE_PERCENTILE = args.hedge_percentile
+    Config.HEDGE_BUDGET = args.hedge_budget
+    Config.HTML_PARSER = args.html_parser
+    Config.SPELL_SOURCE = args.spell_source
+    Config.SNAPSHOT = args.snapshot
+    Config.SNAPSHOT_OFFLINE = args.offline
+    try:
+        get_snapshot()
+    except SnapshotNotFound as exc:
+        sys.exit(f"ERROR: {exc}")
+    configure_http_archive(args)
+    try:
+        get_http_archive()
+    except (OSError, ValueError, KeyError) as exc:
+        sys.exit(f"ERROR: could not read the HTTP archive {args.replay_http}: {exc}")
+
     if args.spell_colors:
         Config.COLORS["spell"] = {
             lvl: color
@@ -159,27 +461,51 @@ def main():
         }
 
     if args.spell_filter:
-        spells_str = SpellFilter(**args.spell_filter.to_dict()).resolve()
-        spells = list(set(spells_str))
-        spells = [CliSpell.from_str(spell_str) for spell_str in spells_str]
-
-    spells = args.spells + spells
-    cards.extend(
-        export_spells_to_cards(spells, include_legend=args.include_spell_legend)
-    )
-    cards.extend(export_items_to_cards(args.items))
-    cards.extend(export_feats_to_cards(args.feats))
-    cards.extend(export_eldricht_invocations_to_cards(args.eldricht_invocations))
-    cards.extend(export_class_features_to_cards(args.class_features))
-    cards.extend(export_ancestry_features_to_cards(args.ancestry_features))
-    cards.extend(export_backgrounds_to_cards(args.backgrounds))
-
-    cards_json = json.dumps(cards, indent=2, ensure_ascii=False)
-    if args.output:
-        with open(args.output, "w") as out:
-            out.write(cards_json)
+        spells = get_spell_catalogue().resolve(
+            [
+                SpellFilter(**spell_filter.to_dict())
+                for spell_filter in args.spell_filter
+            ]
+        )
+
+    # Spells both listed and matching a filter are only exported once
+    spells = list(
+        {(spell.lang, spell.slug): spell for spell in args.spells + spells}.values()
+    )
+    elements = dict(
+        spells=spells,
+        items=args.items,
+        feats=args.feats,
+        eldricht_invocations=args.eldricht_invocations,
+        class_features=args.class_features,
+        ancestry_features=args.ancestry_features,
+        backgrounds=args.backgrounds,
+        include_spell_legend=args.include_spell_legend,
+    )
+    if args.engine == "asyncio":
+        cards = asyncio.run(aexport_cards(**elements))
     else:
-        sys.stdout.write(cards_json)
+        cards = iter_cards(**elements, ordered=not args.unordered)
+
+    with open_output(args.output) as out:
+        writer = WRITERS[args.output_format](out)
+        for card in cards:
+            writer.write(card)
+        writer.close()
+
+    if args.http_stats:
+        print(f"HTTP: {connection_stats()}", file=sys.stderr)
+        if (hedger := get_hedger()) is not None:
+            print(f"Hedging: {hedger}", file=sys.stderr)
+
+    if (profiler := get_profiler()) is not None:
+        report = args.profile or args.memory_profile
+        with open(report, "w") as f:
+            if args.profile_format == "folded":
+                profiler.write_folded(f)
+            else:
+                profiler.write_json(f)
+        print(f"Profile written to {report}", file=sys.stderr)
 
 
 if __name__ == "__main__":
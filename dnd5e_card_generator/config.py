@@ -1,5 +1,56 @@
+import os
+from pathlib import Path
+
+
 class Config:
     BYPASS_CACHE: bool = False
+    CACHE_DIR: Path = (
+        Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        / "dnd5e-card-generator"
+    )
+    # Cached pages older than this number of seconds are revalidated with a conditional request
+    CACHE_TTL: float = 30 * 24 * 3600
+    # Size budget of the page cache, in bytes
+    CACHE_MAX_SIZE: int = 200 * 1024 * 1024
+    # Number of pages scraped concurrently, also used to size the HTTP connection pool
+    MAX_WORKERS: int = 5
+    # Number of pages fetched concurrently from the same host (default: MAX_WORKERS)
+    MAX_WORKERS_PER_HOST: int | None = None
+    # Number of processes parsing the fetched pages
+    PARSE_WORKERS: int = os.cpu_count() or 1
+    # BeautifulSoup parser backend: "lxml", "html.parser" or "auto" (lxml if installed)
+    HTML_PARSER: str = "auto"
+    # (connect, read) timeouts in seconds, applied to every HTTP request
+    HTTP_TIMEOUT: tuple[float, float] = (5.0, 30.0)
+    # Maximum duration of a request in seconds, retries included
+    HTTP_DEADLINE: float = 120.0
+    # Number of retries of the requests failing with 429/5xx or a connection error
+    HTTP_RETRIES: int = 3
+    # Base and maximum of the exponential backoff between retries, in seconds
+    HTTP_BACKOFF: float = 0.5
+    HTTP_BACKOFF_MAX: float = 30.0
+    # Average number of requests per second sent to the same host (None: no limit),
+    # and number of requests that can be sent in a burst
+    MAX_REQUESTS_PER_SECOND: float | None = None
+    REQUESTS_BURST: int = 1
+    # Requests slower than this percentile of the recent request latencies are sent
+    # again, the first response winning (None: no hedging)
+    HEDGE_PERCENTILE: float | None = None
+    # Maximum number of hedged requests, as a fraction of the requests sent
+    HEDGE_BUDGET: float = 0.05
+    # Source of the english spells: "aidedd" or "5esheets" (offline, from data/spells.json)
+    SPELL_SOURCE: str = "aidedd"
+    # Version of the local aidedd snapshot the pages are read from ("latest" for the
+    # most recent one), or None to fetch them from aidedd
+    SNAPSHOT: str | None = None
+    # Fail on the pages missing from the snapshot, instead of fetching them from aidedd
+    SNAPSHOT_OFFLINE: bool = False
+    # HTTP archive file the requests are recorded into or replayed from (None: neither),
+    # HTTP_ARCHIVE_MODE being "record" or "replay"
+    HTTP_ARCHIVE: Path | None = None
+    HTTP_ARCHIVE_MODE: str = "record"
+    # Latency injected before each replayed response, in seconds, or "recorded"
+    REPLAY_LATENCY: float | str | None = None
     COLORS = {
         "class_feature": "indianred",
         "background": "#ff9aac",
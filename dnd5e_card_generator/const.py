@@ -1,24 +1,31 @@
-import json
+import os
 from pathlib import Path
 
+from dnd5e_card_generator.datasets import IndexedJSONDataset, JSONDataset
+
 DATA_DIR = Path(__file__).parent.parent / "data"
-AIDEDD_SPELLS_URL = "https://www.aidedd.org/dnd/sorts.php"
+# Overridable, without trailing slash, to point the scrapers at a local stand-in
+# of aidedd such as benchmarks/stub_server.py
+AIDEDD_BASE_URL = os.environ.get("AIDEDD_BASE_URL", "https://www.aidedd.org")
+AIDEDD_SPELLS_URL = f"{AIDEDD_BASE_URL}/dnd/sorts.php"
 AIDEDD_CLASS_RULES_URL = {
-    "fr": "https://www.aidedd.org/regles/classes/{class_}",
-    "en": "https://www.aidedd.org/en/rules/classes/{class_}/",
+    "fr": f"{AIDEDD_BASE_URL}/regles/classes/{{class_}}",
+    "en": f"{AIDEDD_BASE_URL}/en/rules/classes/{{class_}}/",
 }
 AIDEDD_BACKGROUND_URL = {
-    "fr": "https://www.aidedd.org/regles/historiques/{background}/",
-    "en": "https://www.aidedd.org/en/rules/background/{background}/",
+    "fr": f"{AIDEDD_BASE_URL}/regles/historiques/{{background}}/",
+    "en": f"{AIDEDD_BASE_URL}/en/rules/background/{{background}}/",
 }
 AIDEDD_RACE_RULES_URL = {
-    "fr": "https://www.aidedd.org/regles/races/{ancestry}",
-    "en": "https://www.aidedd.org/en/rules/races/{ancestry}",
+    "fr": f"{AIDEDD_BASE_URL}/regles/races/{{ancestry}}",
+    "en": f"{AIDEDD_BASE_URL}/en/rules/races/{{ancestry}}",
 }
-AIDEDD_ELDRICHT_INVOCATIONS_URL = "https://www.aidedd.org/dnd/invocations.php"
-AIDEDD_FEATS_ITEMS_URL = "https://www.aidedd.org/dnd/dons.php"
-AIDEDD_MAGIC_ITEMS_URL = "https://www.aidedd.org/dnd/om.php"
-AIDEDD_SPELLS_FILTER_URL = "https://www.aidedd.org/dnd-filters/sorts.php"
-AIDEDD_UNEARTHED_ARCANA_URL = "https://www.aidedd.org/dnd-5/unearthed-arcana/{class_}"
-SPELLS_BY_TYPE = json.load(open(DATA_DIR / "spell_by_types.json"))
-FIVE_E_SHEETS_SPELLS = json.load(open(DATA_DIR / "spells.json"))
+AIDEDD_ELDRICHT_INVOCATIONS_URL = f"{AIDEDD_BASE_URL}/dnd/invocations.php"
+AIDEDD_FEATS_ITEMS_URL = f"{AIDEDD_BASE_URL}/dnd/dons.php"
+AIDEDD_MAGIC_ITEMS_URL = f"{AIDEDD_BASE_URL}/dnd/om.php"
+AIDEDD_SPELLS_FILTER_URL = f"{AIDEDD_BASE_URL}/dnd-filters/sorts.php"
+AIDEDD_UNEARTHED_ARCANA_URL = f"{AIDEDD_BASE_URL}/dnd-5/unearthed-arcana/{{class_}}"
+SPELLS_BY_TYPE = JSONDataset(DATA_DIR / "spell_by_types.json")
+FIVE_E_SHEETS_SPELLS = IndexedJSONDataset(
+    DATA_DIR / "spells.json", index_path=DATA_DIR / "spells.index.json"
+)
@@ -0,0 +1,165 @@
+"""Lazy access to the JSON datasets bundled in the data/ directory.
+
+The datasets are JSON objects mapping a title to a record. Nothing is read
+when they are instantiated, and lookups are case, accent and apostrophe
+insensitive.
+
+The large datasets are read through a precomputed index of the byte offsets
+of each record, so that only the records a run touches are decoded. The index
+is rebuilt with:
+
+    python -m dnd5e_card_generator.datasets
+
+"""
+
+import hashlib
+import json
+import threading
+from collections.abc import Iterator, Mapping
+from functools import cached_property
+from pathlib import Path
+from typing import Any
+
+from dnd5e_card_generator.utils import strip_accents
+
+
+def normalize_title(title: str) -> str:
+    title = strip_accents(title).replace("’", "'")
+    return " ".join(title.casefold().split())
+
+
+def file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def file_signature(path: Path) -> dict[str, int]:
+    """Return the size and modification time of the file, cheaper than its digest"""
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class JSONDataset(Mapping[str, Any]):
+    """Small dataset, decoded as a whole the first time it is accessed"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @cached_property
+    def records(self) -> dict[str, Any]:
+        with open(self.path) as f:
+            return {normalize_title(k): v for k, v in json.load(f).items()}
+
+    def __getitem__(self, title: str) -> Any:
+        return self.records[normalize_title(title)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class IndexedJSONDataset(Mapping[str, Any]):
+    """Large dataset, of which each record is decoded on first access.
+
+    The index maps each normalized title to the (offset, length) of the record
+    in the dataset file. It is stored along with the size, modification time
+    and digest of the dataset it was computed from, and computed again in
+    memory when stale. The digest is only checked when the size or the
+    modification time differ, such as after a checkout.
+
+    """
+
+    def __init__(self, path: Path, index_path: Path):
+        self.path = path
+        self.index_path = index_path
+        self.decoded: dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    @cached_property
+    def index(self) -> dict[str, tuple[int, int]]:
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        if index.get("signature") != file_signature(self.path):
+            # Copied or touched, such as by a checkout: compare the contents
+            if index.get("digest") != file_digest(self.path):
+                return self.build_index()
+        return {title: tuple(span) for title, span in index["records"].items()}
+
+    def build_index(self) -> dict[str, tuple[int, int]]:
+        """Scan the dataset file and return the byte span of each record"""
+        # Decode the raw bytes, as read_text() would translate the newlines
+        text = self.path.read_bytes().decode()
+        decoder = json.JSONDecoder()
+        index: dict[str, tuple[int, int]] = {}
+        # Character offsets are converted to byte offsets incrementally, as
+        # records may contain non-ascii characters
+        mark, byte_mark = 0, 0
+
+        def byte_offset(position: int) -> int:
+            nonlocal mark, byte_mark
+            byte_mark += len(text[mark:position].encode())
+            mark = position
+            return byte_mark
+
+        def skip(position: int, chars: str = " \t\r\n") -> int:
+            while text[position] in chars:
+                position += 1
+            return position
+
+        position = skip(text.index("{") + 1)
+        while text[position] != "}":
+            title, position = decoder.raw_decode(text, position)
+            start = skip(skip(position, " \t\r\n:"))
+            _, end = decoder.raw_decode(text, start)
+            byte_start = byte_offset(start)
+            index[normalize_title(title)] = (byte_start, byte_offset(end) - byte_start)
+            position = skip(end, " \t\r\n,")
+        return index
+
+    def write_index(self):
+        with open(self.index_path, "w") as f:
+            json.dump(
+                {
+                    "signature": file_signature(self.path),
+                    "digest": file_digest(self.path),
+                    "records": self.build_index(),
+                },
+                f,
+                separators=(",", ":"),
+                ensure_ascii=False,
+            )
+            f.write("\n")
+
+    def __getitem__(self, title: str) -> Any:
+        key = normalize_title(title)
+        if key in self.decoded:
+            return self.decoded[key]
+        offset, length = self.index[key]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.read(length))
+        with self.lock:
+            return self.decoded.setdefault(key, record)
+
+    def __contains__(self, title: object) -> bool:
+        return isinstance(title, str) and normalize_title(title) in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+if __name__ == "__main__":
+    from dnd5e_card_generator.const import FIVE_E_SHEETS_SPELLS
+
+    FIVE_E_SHEETS_SPELLS.write_index()
+    print(
+        f"{len(FIVE_E_SHEETS_SPELLS)} records indexed in "
+        f"{FIVE_E_SHEETS_SPELLS.index_path}"
+    )
@@ -1,5 +1,7 @@
-import concurrent.futures
+import asyncio
+from typing import Any, Iterator
 
+from dnd5e_card_generator.config import Config
 from dnd5e_card_generator.models import (
     CliAncestryFeature,
     CliBackground,
@@ -10,6 +12,8 @@ from dnd5e_card_generator.models import (
     CliSpell,
     Language,
 )
+from dnd5e_card_generator.metrics import CARDS, card_type
+from dnd5e_card_generator.profiling import profile_item
 from dnd5e_card_generator.scraping.aidedd import (
     AncestryFeatureScraper,
     BackgroundScraper,
@@ -19,23 +23,69 @@ from dnd5e_card_generator.scraping.aidedd import (
     MagicItemScraper,
     SpellScraper,
 )
+from dnd5e_card_generator.scraping.async_engine import AsyncScrapingEngine
+from dnd5e_card_generator.scraping.five_e_sheets import FiveESheetsSpellScraper
 
+from .scheduler import CardScheduler
 from .spell import SpellLegend
 
 
+def sort_spells(spell):
+    return (spell.level, spell.title)
+
+
+def sort_items(item):
+    return (int(item.rarity), item.title)
+
+
+def sort_class_features(item):
+    return (item.class_name, item.title)
+
+
+def sort_by_title(item):
+    return item.title
+
+
+def spell_scraper(slug: str, lang: Language) -> SpellScraper | FiveESheetsSpellScraper:
+    """Return the scraper of a spell, according to the configured spell source.
+
+    French spells are always scraped from aidedd.
+
+    """
+    if lang == "en" and Config.SPELL_SOURCE == "5esheets":
+        return FiveESheetsSpellScraper(slug=slug, lang=lang)
+    return SpellScraper(slug=slug, lang=lang)
+
+
+def spell_legend_card() -> dict:
+    CARDS.inc(card_type="spell_legend")
+    return SpellLegend(lang=Language("fr")).to_card()
+
+
 def export_elements_to_cards(elements, ScraperCls, sorting_func):
+    scheduler = CardScheduler()
+    scheduler.add(elements, ScraperCls, sorting_func)
+    return scheduler.run()[0]
+
+
+async def aexport_elements_to_cards(
+    elements, ScraperCls, sorting_func, engine: AsyncScrapingEngine
+):
     if not elements:
         return []
 
-    tasks, models = [], []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        for element in elements:
-            scraper = ScraperCls(**element.to_dict())
-            tasks.append(executor.submit(scraper.scrape))
-        for future in concurrent.futures.as_completed(tasks):
-            models.append(future.result())
-    models = sorted(models, key=sorting_func)
-    return [model.to_card() for model in models]
+    async def scrape_to_card(scraper) -> tuple[Any, dict]:
+        # Each model is rendered as soon as scraped, and isn't kept afterwards
+        model = await engine.scrape(scraper)
+        with profile_item(scraper):
+            card = sorting_func(model), model.to_card()
+        CARDS.inc(card_type=card_type(scraper))
+        return card
+
+    scrapers = [ScraperCls(**element.to_dict()) for element in elements]
+    engine.expect(scrapers)
+    cards = await asyncio.gather(*(scrape_to_card(scraper) for scraper in scrapers))
+    return [card for _, card in sorted(cards, key=lambda card: card[0])]
 
 
 def export_spells_to_cards(
@@ -43,17 +93,20 @@ def export_spells_to_cards(
 ) -> list[dict]:
     """Scrape Aidedd for the provided spells and export them as cards data.
 
+    English spells are built from the bundled 5e-sheets dataset instead when
+    Config.SPELL_SOURCE is "5esheets".
+
     If include_legend=True, then a legend card will be generated and added at the end
     of the spell cards.
 
     """
     cards = export_elements_to_cards(
         elements=spell_names,
-        ScraperCls=SpellScraper,
-        sorting_func=lambda spell: (spell.level, spell.title),
+        ScraperCls=spell_scraper,
+        sorting_func=sort_spells,
     )
     if include_legend:
-        cards.append(SpellLegend(lang=Language("fr")).to_card())
+        cards.append(spell_legend_card())
     return cards
 
 
@@ -62,7 +115,7 @@ def export_items_to_cards(item_names: list[CliMagicItem]) -> list[dict]:
     return export_elements_to_cards(
         elements=item_names,
         ScraperCls=MagicItemScraper,
-        sorting_func=lambda item: (int(item.rarity), item.title),
+        sorting_func=sort_items,
     )
 
 
@@ -71,7 +124,7 @@ def export_feats_to_cards(feat_names: list[CliFeat]) -> list[dict]:
     return export_elements_to_cards(
         elements=feat_names,
         ScraperCls=FeatScraper,
-        sorting_func=lambda item: item.title,
+        sorting_func=sort_by_title,
     )
 
 
@@ -79,7 +132,7 @@ def export_class_features_to_cards(class_features: list[CliClassFeature]) -> lis
     return export_elements_to_cards(
         elements=class_features,
         ScraperCls=CharacterClassFeatureScraper,
-        sorting_func=lambda item: (item.class_name, item.title),
+        sorting_func=sort_class_features,
     )
 
 
@@ -89,7 +142,7 @@ def export_eldricht_invocations_to_cards(
     return export_elements_to_cards(
         elements=eldricht_invocations,
         ScraperCls=EldrichInvocationScraper,
-        sorting_func=lambda item: item.title,
+        sorting_func=sort_by_title,
     )
 
 
@@ -99,7 +152,7 @@ def export_ancestry_features_to_cards(
     return export_elements_to_cards(
         elements=ancestry_features,
         ScraperCls=AncestryFeatureScraper,
-        sorting_func=lambda item: item.title,
+        sorting_func=sort_by_title,
     )
 
 
@@ -107,5 +160,113 @@ def export_backgrounds_to_cards(backgrounds: list[CliBackground]) -> list[dict]:
     return export_elements_to_cards(
         elements=backgrounds,
         ScraperCls=BackgroundScraper,
-        sorting_func=lambda item: item.title,
+        sorting_func=sort_by_title,
+    )
+
+
+def export_categories(
+    spells,
+    items,
+    feats,
+    eldricht_invocations,
+    class_features,
+    ancestry_features,
+    backgrounds,
+) -> list[tuple]:
+    """Return the (elements, scraper class, sorting function) of each category, in card order"""
+    return [
+        (spells, spell_scraper, sort_spells),
+        (items, MagicItemScraper, sort_items),
+        (feats, FeatScraper, sort_by_title),
+        (eldricht_invocations, EldrichInvocationScraper, sort_by_title),
+        (class_features, CharacterClassFeatureScraper, sort_class_features),
+        (ancestry_features, AncestryFeatureScraper, sort_by_title),
+        (backgrounds, BackgroundScraper, sort_by_title),
+    ]
+
+
+def iter_cards(
+    spells: list[CliSpell] | None = None,
+    items: list[CliMagicItem] | None = None,
+    feats: list[CliFeat] | None = None,
+    eldricht_invocations: list[CliEldrichtInvocation] | None = None,
+    class_features: list[CliClassFeature] | None = None,
+    ancestry_features: list[CliAncestryFeature] | None = None,
+    backgrounds: list[CliBackground] | None = None,
+    include_spell_legend: bool = False,
+    ordered: bool = True,
+) -> Iterator[dict]:
+    """Scrape Aidedd and yield the cards data of all the elements, as soon as exported.
+
+    All categories are exported by a single scheduler, sharing the same fetch
+    and parse workers. If ordered=True, the cards of each category are yielded
+    in the same order as the category exporters, as soon as all the cards of
+    the category and the ones before it are exported. Otherwise, cards are
+    yielded as soon as they are scraped.
+
+    """
+    scheduler = CardScheduler()
+    for elements, ScraperCls, sorting_func in export_categories(
+        spells,
+        items,
+        feats,
+        eldricht_invocations,
+        class_features,
+        ancestry_features,
+        backgrounds,
+    ):
+        scheduler.add(elements or [], ScraperCls, sorting_func)
+    if include_spell_legend and not ordered:
+        yield spell_legend_card()
+    for category, cards in scheduler.iter_results(ordered=ordered):
+        yield from cards
+        if include_spell_legend and ordered and category == 0:
+            yield spell_legend_card()
+
+
+def export_cards(**kwargs) -> list[dict]:
+    """Scrape Aidedd and export all the elements as cards data, in order.
+
+    See iter_cards for the accepted arguments.
+
+    """
+    return list(iter_cards(**kwargs))
+
+
+async def aexport_cards(
+    spells: list[CliSpell] | None = None,
+    items: list[CliMagicItem] | None = None,
+    feats: list[CliFeat] | None = None,
+    eldricht_invocations: list[CliEldrichtInvocation] | None = None,
+    class_features: list[CliClassFeature] | None = None,
+    ancestry_features: list[CliAncestryFeature] | None = None,
+    backgrounds: list[CliBackground] | None = None,
+    include_spell_legend: bool = False,
+    concurrency: int | None = None,
+) -> list[dict]:
+    """Scrape Aidedd with the asyncio engine and export all the elements as cards data.
+
+    All categories are fetched concurrently, sharing a single connection pool and
+    at most `concurrency` requests in flight (default: Config.MAX_WORKERS). The
+    cards are returned in the same order as the synchronous exporters.
+
+    """
+    categories = export_categories(
+        spells,
+        items,
+        feats,
+        eldricht_invocations,
+        class_features,
+        ancestry_features,
+        backgrounds,
     )
+    async with AsyncScrapingEngine(concurrency=concurrency) as engine:
+        cards_by_category = await asyncio.gather(
+            *(
+                aexport_elements_to_cards(elements, ScraperCls, sorting_func, engine)
+                for elements, ScraperCls, sorting_func in categories
+            )
+        )
+    if include_spell_legend:
+        cards_by_category[0].append(spell_legend_card())
+    return [card for cards in cards_by_category for card in cards]
@@ -1,4 +1,5 @@
 import re
+import sys
 from dataclasses import dataclass
 from typing import Callable, Protocol
 
@@ -12,6 +13,7 @@ from dnd5e_card_generator.models import (
     DamageType,
     Language,
 )
+from dnd5e_card_generator.profiling import profiled
 from dnd5e_card_generator.utils import (
     damage_type_text,
     game_icon,
@@ -28,6 +30,7 @@ class FormatterProtocol(Protocol):
 class BaseCardTextFormatter(FormatterProtocol):
 
     @staticmethod
+    @profiled("regex")
     def map_string_transformations(
         s: str, functions: list[Callable[[str], str]]
     ) -> str:
@@ -249,6 +252,7 @@ class BaseCardTextFormatter(FormatterProtocol):
     def image(self) -> str | None:
         return getattr(self, "image_url", None)
 
+    @profiled("render")
     def to_card(self) -> dict:
         try:
             card = Card(
@@ -259,7 +263,7 @@ class BaseCardTextFormatter(FormatterProtocol):
                 background_image=self.image,
             )
         except Exception as exc:
-            print(f"ERROR: failed generating card for {self.title}")
+            print(f"ERROR: failed generating card for {self.title}", file=sys.stderr)
             raise exc
         return card.to_dict()
 
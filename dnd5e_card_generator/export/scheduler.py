@@ -0,0 +1,260 @@
+"""Schedule the export of cards of every category in a single two-stage pipeline.
+
+Pages are fetched by a pool of threads, and each fetched page is then parsed
+and scraped into cards by a pool of processes, while the other pages are still
+downloading.
+
+"""
+
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+from urllib.parse import urlparse
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.metrics import CARDS, card_type, record_scrape_failure
+from dnd5e_card_generator.profiling import profile_item
+from dnd5e_card_generator.scraping.model_cache import cached_scrape
+from dnd5e_card_generator.scraping.registry import PageRegistry
+
+
+def _init_parse_worker(config: dict[str, Any]):
+    """Apply the configuration of the main process to a parse worker.
+
+    Workers are not necessarily forked, so they don't always inherit the
+    configuration set by the CLI.
+
+    """
+    for key, value in config.items():
+        setattr(Config, key, value)
+
+
+def scrape_to_cards(
+    items: list["WorkItem"], html: str | None
+) -> list[tuple[Any, dict]]:
+    """Parse a fetched page, and return the cards of its items along with their sort key.
+
+    This runs in a parse worker process, and only exchanges plain data with the
+    main process. The page is parsed once for all its items, and its parsed
+    document is discarded as soon as their models are built, so that the
+    memory used by a worker doesn't grow with the number of pages. The page
+    is not parsed at all if every model is found in the model cache.
+
+    """
+    page_registry: PageRegistry = PageRegistry()
+    cards = []
+    for item in items:
+        scraper = item.ScraperCls(**item.scraper_kwargs)
+        if not scraper.offline:
+            scraper.html = html
+            scraper.page_registry = page_registry
+        with profile_item(scraper):
+            model = cached_scrape(scraper)
+            cards.append((item.sorting_func(model), model.to_card()))
+    return cards
+
+
+def parse_executor(tasks: int) -> concurrent.futures.Executor:
+    """Return the executor parsing the fetched pages.
+
+    Parsing and scraping are CPU bound, and are run in a pool of processes to
+    escape the GIL, unless a single parse worker is configured.
+
+    """
+    config = {key: value for key, value in vars(Config).items() if key.isupper()}
+    workers = min(Config.PARSE_WORKERS, tasks)
+    if workers <= 1:
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, initializer=_init_parse_worker, initargs=(config,)
+        )
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_parse_worker, initargs=(config,)
+    )
+
+
+@dataclass
+class WorkItem:
+    """A card to export"""
+
+    category: int
+    position: int
+    ScraperCls: Callable
+    scraper_kwargs: dict
+    sorting_func: Callable
+    card_type: str
+
+
+@dataclass
+class Page:
+    """A page to fetch, along with the cards scraped from it"""
+
+    key: str
+    host: str
+    fetch: Callable[[], str]
+    items: list[WorkItem] = field(default_factory=list)
+
+
+class CardScheduler:
+    """Export the cards of several categories, sharing the same worker pools.
+
+    - at most `jobs` pages are fetched concurrently, whatever their category
+    - at most `jobs_per_host` pages are fetched concurrently from the same host
+    - pages are fetched only while fewer than `jobs` fetched pages are waiting
+      to be parsed, so that the pages are not all held in memory
+
+    Each category of cards is returned in its own sort order:
+
+        scheduler = CardScheduler()
+        scheduler.add(spells, spell_scraper, sort_spells)
+        scheduler.add(items, MagicItemScraper, sort_items)
+        spell_cards, item_cards = scheduler.run()
+
+    """
+
+    def __init__(self, jobs: int | None = None, jobs_per_host: int | None = None):
+        self.jobs = jobs or Config.MAX_WORKERS
+        self.jobs_per_host = jobs_per_host or Config.MAX_WORKERS_PER_HOST or self.jobs
+        self.categories = 0
+        self.pages: dict[str, Page] = {}
+        # Items of offline scrapers, which don't need any page
+        self.offline_items: list[WorkItem] = []
+
+    def add(self, elements: list, ScraperCls: Callable, sorting_func: Callable) -> int:
+        """Schedule the export of the elements, and return the index of their category"""
+        category = self.categories
+        self.categories += 1
+        for position, element in enumerate(elements):
+            scraper_kwargs = element.to_dict()
+            scraper = ScraperCls(**scraper_kwargs)
+            item = WorkItem(
+                category,
+                position,
+                ScraperCls,
+                scraper_kwargs,
+                sorting_func,
+                card_type(scraper),
+            )
+            if scraper.offline:
+                self.offline_items.append(item)
+                continue
+            # Each page is only fetched once, even if several cards are scraped from it
+            if (page := self.pages.get(scraper.page_key)) is None:
+                page = self.pages[scraper.page_key] = Page(
+                    key=scraper.page_key,
+                    host=urlparse(scraper.base_url).netloc,
+                    fetch=scraper.fetch_data,
+                )
+            page.items.append(item)
+        return category
+
+    @property
+    def tasks(self) -> int:
+        return len(self.offline_items) + sum(
+            len(page.items) for page in self.pages.values()
+        )
+
+    def run(self) -> list[list[dict]]:
+        """Return the cards of each category, in their sort order"""
+        return [cards for _, cards in self.iter_results()]
+
+    def iter_results(self, ordered: bool = True) -> Iterator[tuple[int, list[dict]]]:
+        """Yield the (category, cards) results as soon as they are available.
+
+        If ordered=True, each category is yielded as a whole, in its sort order,
+        as soon as it is complete, as well as all the categories before it.
+        Otherwise, each card is yielded as soon as it is scraped.
+
+        """
+        results: list[list[tuple[Any, int, dict]]] = [
+            [] for _ in range(self.categories)
+        ]
+        remaining = [0] * self.categories
+        for item in self.offline_items:
+            remaining[item.category] += 1
+        for page in self.pages.values():
+            for item in page.items:
+                remaining[item.category] += 1
+        next_category = 0
+
+        def complete_categories() -> Iterator[tuple[int, list[dict]]]:
+            nonlocal next_category
+            while next_category < self.categories and not remaining[next_category]:
+                category, next_category = next_category, next_category + 1
+                cards = sorted(results[category], key=lambda result: result[:2])
+                results[category] = []
+                yield category, [card for _, _, card in cards]
+
+        if not self.tasks:
+            yield from complete_categories()
+            return
+
+        # Pages to fetch, per host, fetched in a round-robin fashion across hosts
+        pending: dict[str, deque[Page]] = {}
+        for page in self.pages.values():
+            pending.setdefault(page.host, deque()).append(page)
+        fetching_per_host = dict.fromkeys(pending, 0)
+        # Scraping tasks ready to be submitted to the parse workers: the items
+        # of a fetched page, or a single offline item
+        ready: deque[tuple[list[WorkItem], str | None]] = deque(
+            ([item], None) for item in self.offline_items
+        )
+        fetching: dict[concurrent.futures.Future, Page] = {}
+        parsing: dict[concurrent.futures.Future, list[WorkItem]] = {}
+
+        def next_page() -> Page | None:
+            for host in list(pending):
+                if fetching_per_host[host] < self.jobs_per_host:
+                    page = pending[host].popleft()
+                    if not pending[host]:
+                        del pending[host]
+                    else:
+                        # Move the host at the end of the queue
+                        pending[host] = pending.pop(host)
+                    return page
+            return None
+
+        with (
+            concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as fetch_pool,
+            parse_executor(len(ready) + len(self.pages)) as parse_pool,
+        ):
+            max_parsing = 2 * Config.PARSE_WORKERS
+            while pending or ready or fetching or parsing:
+                while ready and len(parsing) < max_parsing:
+                    items, html = ready.popleft()
+                    parsing[parse_pool.submit(scrape_to_cards, items, html)] = items
+                while len(fetching) < self.jobs and len(ready) < self.jobs:
+                    if (page := next_page()) is None:
+                        break
+                    fetching[fetch_pool.submit(page.fetch)] = page
+                    fetching_per_host[page.host] += 1
+
+                done, _ = concurrent.futures.wait(
+                    list(fetching) + list(parsing),
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    if (page := fetching.pop(future, None)) is not None:
+                        fetching_per_host[page.host] -= 1
+                        if (error := future.exception()) is not None:
+                            for item in page.items:
+                                record_scrape_failure(item.card_type, error)
+                            raise error
+                        ready.append((page.items, future.result()))
+                    else:
+                        items = parsing.pop(future)
+                        if (error := future.exception()) is not None:
+                            # The items of a page are all of the same card type
+                            record_scrape_failure(items[0].card_type, error)
+                            raise error
+                        for item, (sort_key, card) in zip(items, future.result()):
+                            CARDS.inc(card_type=item.card_type)
+                            remaining[item.category] -= 1
+                            if not ordered:
+                                yield item.category, [card]
+                            else:
+                                results[item.category].append(
+                                    (sort_key, item.position, card)
+                                )
+                        if ordered:
+                            yield from complete_categories()
@@ -0,0 +1,54 @@
+"""Write the cards to a stream as soon as they are exported"""
+
+import json
+from typing import TextIO
+
+from dnd5e_card_generator.profiling import profile_stage
+
+
+class JSONArrayWriter:
+    """Write the cards as an indented JSON array, as read by rpg-cards.
+
+    The output is identical to json.dumps(cards, indent=2), but each card is
+    written as soon as it is exported.
+
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, card: dict):
+        separator = "[\n" if not self.count else ",\n"
+        with profile_stage("serialize"):
+            card_json = json.dumps(card, indent=2, ensure_ascii=False)
+        self.stream.write(
+            separator + "\n".join(f"  {line}" for line in card_json.split("\n"))
+        )
+        self.stream.flush()
+        self.count += 1
+
+    def close(self):
+        self.stream.write("\n]" if self.count else "[]")
+        self.stream.flush()
+
+
+class NDJSONWriter:
+    """Write each card as a JSON document on its own line"""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, card: dict):
+        with profile_stage("serialize"):
+            card_json = json.dumps(card, ensure_ascii=False)
+        self.stream.write(card_json + "\n")
+        self.stream.flush()
+        self.count += 1
+
+    def close(self):
+        self.stream.flush()
+
+
+WRITERS = {"json": JSONArrayWriter, "ndjson": NDJSONWriter}
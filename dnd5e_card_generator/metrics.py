@@ -0,0 +1,297 @@
+"""Counters and histograms of a run, to monitor the batch jobs running the generator.
+
+The metrics are always collected, as updating them costs a lock and a dict
+lookup, and are dumped at the end of the run, either in the Prometheus text
+exposition format (as read by the node exporter textfile collector), or as a
+JSON document:
+
+    dnd5e-card-generator --metrics metrics.prom ...
+    dnd5e-card-generator --metrics metrics.json --metrics-format json ...
+
+Metrics are only updated in the main process: the cards scraped by the parse
+worker processes are counted once returned to the scheduler.
+
+"""
+
+import json
+import math
+import threading
+import time
+from typing import Any, Iterator, TextIO
+from urllib.parse import urlparse
+
+from dnd5e_card_generator.utils import pascal_case_to_snake_case
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_sample(name: str, labels: dict[str, str], value: float) -> str:
+    if labels:
+        name += (
+            "{"
+            + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in labels.items())
+            + "}"
+        )
+    if math.isinf(value):
+        return f"{name} {'+Inf' if value > 0 else '-Inf'}"
+    return f"{name} {value:g}" if value != int(value) else f"{name} {int(value)}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict[str, Any]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def labels(self, key: Labels) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Yield the (name, labels, value) samples of the Prometheus exposition"""
+        raise NotImplementedError
+
+    def to_json(self) -> list[dict]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Labels = ()):
+        super().__init__(name, help, labelnames)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield self.name, self.labels(key), value
+
+    def to_json(self) -> list[dict]:
+        return [
+            {"labels": labels, "value": value} for _, labels, value in self.samples()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Number of observations falling in each bucket (not cumulated), along
+        # with their sum
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        bucket = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            if key not in self.counts:
+                self.counts[key] = [0] * len(self.buckets)
+                self.sums[key] = 0.0
+            self.counts[key][bucket] += 1
+            self.sums[key] += value
+
+    def snapshot(self) -> list[tuple[Labels, list[int], float]]:
+        """Return the cumulated bucket counts and the sum of each label set"""
+        with self.lock:
+            series = [
+                (key, list(counts), self.sums[key])
+                for key, counts in sorted(self.counts.items())
+            ]
+        for _, counts, _ in series:
+            for i in range(1, len(counts)):
+                counts[i] += counts[i - 1]
+        return series
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, counts, total in self.snapshot():
+            labels = self.labels(key)
+            for bound, count in zip(self.buckets, counts):
+                le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+                yield f"{self.name}_bucket", {**labels, "le": le}, count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, counts[-1]
+
+    def to_json(self) -> list[dict]:
+        return [
+            {
+                "labels": self.labels(key),
+                "buckets": {
+                    ("+Inf" if math.isinf(bound) else f"{bound:g}"): count
+                    for bound, count in zip(self.buckets, counts)
+                },
+                "sum": total,
+                "count": counts[-1],
+            }
+            for key, counts, total in self.snapshot()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Labels = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Labels = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def write_prometheus(self, stream: TextIO):
+        for metric in self.metrics.values():
+            stream.write(f"# HELP {metric.name} {metric.help}\n")
+            stream.write(f"# TYPE {metric.name} {metric.type}\n")
+            for name, labels, value in metric.samples():
+                stream.write(format_sample(name, labels, value) + "\n")
+
+    def write_json(self, stream: TextIO):
+        json.dump(
+            {
+                "created_at": time.time(),
+                "metrics": {
+                    metric.name: {
+                        "type": metric.type,
+                        "help": metric.help,
+                        "samples": metric.to_json(),
+                    }
+                    for metric in self.metrics.values()
+                },
+            },
+            stream,
+            indent=2,
+            ensure_ascii=False,
+        )
+
+
+METRICS = MetricsRegistry()
+
+PAGE_CACHE_REQUESTS = METRICS.counter(
+    "dnd5e_page_cache_requests_total",
+    "Pages fetched, by result: snapshot, hit, revalidated (304) or miss (downloaded)",
+    ("result",),
+)
+HTTP_REQUESTS = METRICS.counter(
+    "dnd5e_http_requests_total",
+    "HTTP requests sent, retries included, by host and status (error: no response)",
+    ("host", "status"),
+)
+HTTP_RETRIES = METRICS.counter(
+    "dnd5e_http_retries_total",
+    "HTTP requests retried after a 429/5xx response or a connection error, by host",
+    ("host",),
+)
+HTTP_RESPONSE_BYTES = METRICS.counter(
+    "dnd5e_http_response_bytes_total",
+    "Size of the response bodies downloaded, by host",
+    ("host",),
+)
+HTTP_REQUEST_DURATION = METRICS.histogram(
+    "dnd5e_http_request_duration_seconds",
+    "Latency of the HTTP requests, by host",
+    ("host",),
+)
+CARDS = METRICS.counter(
+    "dnd5e_cards_total",
+    "Cards exported, by card type",
+    ("card_type",),
+)
+SCRAPE_FAILURES = METRICS.counter(
+    "dnd5e_scrape_failures_total",
+    "Cards that could not be exported, by card type and cause (exception class)",
+    ("card_type", "cause"),
+)
+RUN_DURATION = METRICS.gauge(
+    "dnd5e_run_duration_seconds",
+    "Duration of the run",
+)
+RUN_SUCCESS = METRICS.gauge(
+    "dnd5e_run_success",
+    "1 if every card of the run was exported, 0 otherwise",
+)
+
+
+def get_metrics() -> MetricsRegistry:
+    return METRICS
+
+
+def card_type(scraper) -> str:
+    """Return the card type of the scraper, such as magic_item"""
+    return pascal_case_to_snake_case(scraper.model.__name__)
+
+
+def record_http_response(
+    url: str, status: int | None, elapsed: float, body_size: int = 0
+):
+    """Record a response (or a failed request, when status is None)"""
+    host = urlparse(url).netloc
+    HTTP_REQUESTS.inc(host=host, status=status or "error")
+    HTTP_REQUEST_DURATION.observe(elapsed, host=host)
+    if body_size:
+        HTTP_RESPONSE_BYTES.inc(body_size, host=host)
+
+
+def record_http_retry(url: str):
+    HTTP_RETRIES.inc(host=urlparse(url).netloc)
+
+
+def record_scrape_failure(card_type: str, exc: BaseException):
+    SCRAPE_FAILURES.inc(card_type=card_type, cause=type(exc).__name__)
@@ -290,6 +290,15 @@ class SpellShape(BaseModel):
         }
         return mapping.get(tag)
 
+    @classmethod
+    def from_5esheet_area_tags(cls, area_tags: list[str]) -> Optional["SpellShape"]:
+        # Single and multiple targets are not shapes
+        area_tags = [tag for tag in area_tags if tag not in ["ST", "MT"]]
+        if area_tags:
+            # If several shapes are found, we randomly pick the first one
+            return cls.from_5esheet_tag(area_tags[0])
+        return None
+
 
 class SpellType(BaseModel):
     """Translate and assign an icon to all types of spells
@@ -0,0 +1,361 @@
+"""Wall and CPU time spent in each stage of a run, per card type and per item.
+
+Stages are nested: the time spent in a stage includes the time spent in the
+stages run within it, and a stage is identified by its path, such as
+"scrape;parse". The stages run for a card are attributed to it with
+profile_item:
+
+    with profile_item(scraper), profile_stage("scrape"):
+        model = scraper.scrape()
+
+When profiling is disabled, both functions return a shared no-op context
+manager, so that instrumenting a function costs a global lookup.
+
+The report is either a JSON document, or a flamegraph in the folded stacks
+format read by flamegraph.pl and speedscope, weighted by wall time.
+
+The memory profiler instead traces the allocations with tracemalloc, and
+takes a snapshot at the end of the fetch, parse, scrape, render and serialize
+stages, to report the allocation sites holding the most memory at each
+stage boundary, per card type, along with the peak RSS.
+
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Iterator, TextIO, TypeVar
+
+from dnd5e_card_generator.metrics import card_type
+
+F = TypeVar("F", bound=Callable)
+
+# Card type of the stages run outside of any item, such as writing the output
+NO_ITEM = "all"
+# Number of slowest items reported per card type
+SLOWEST_ITEMS = 10
+# Stages at the end of which the memory profiler takes a snapshot
+MEMORY_BOUNDARIES = ("fetch", "parse", "scrape", "render", "serialize")
+# Number of allocation sites reported per card type and stage boundary
+TOP_ALLOCATION_SITES = 10
+# A new snapshot is only taken at a stage boundary once the traced memory grew
+# by this factor since the previous one, so that the number of snapshots is
+# logarithmic in the peak memory rather than linear in the number of cards
+SNAPSHOT_GROWTH = 1.1
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    # Wall time spent in the stages run within this one
+    children_wall: float = 0.0
+
+
+@dataclass(frozen=True)
+class ProfileContext:
+    card_type: str = NO_ITEM
+    item: str = ""
+    stack: tuple[str, ...] = ()
+
+
+# Context variables follow both threads and asyncio tasks
+_context: contextvars.ContextVar[ProfileContext] = contextvars.ContextVar(
+    "profile_context", default=ProfileContext()
+)
+
+
+class StageProfiler:
+    def __init__(self):
+        self.stages: dict[tuple[str, tuple[str, ...]], StageStats] = defaultdict(
+            StageStats
+        )
+        # Wall time of the outermost stages of each (card type, item)
+        self.items: dict[tuple[str, str], float] = defaultdict(float)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def item(self, scraper) -> Iterator[None]:
+        token = _context.set(ProfileContext(card_type(scraper), scraper.item_key))
+        try:
+            yield
+        finally:
+            _context.reset(token)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        context = _context.get()
+        path = context.stack + (name,)
+        token = _context.set(
+            ProfileContext(context.card_type, context.item, stack=path)
+        )
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            # The CPU time is the one of the current thread, which includes the
+            # time spent by other asyncio tasks while awaiting
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            _context.reset(token)
+            with self.lock:
+                stats = self.stages[(context.card_type, path)]
+                stats.calls += 1
+                stats.wall += wall
+                stats.cpu += cpu
+                if context.stack:
+                    self.stages[
+                        (context.card_type, context.stack)
+                    ].children_wall += wall
+                else:
+                    self.items[(context.card_type, context.item)] += wall
+
+    def report(self) -> dict[str, Any]:
+        with self.lock:
+            stages = sorted(self.stages.items())
+            items = sorted(self.items.items(), key=lambda item: -item[1])
+        by_stage: dict[str, StageStats] = defaultdict(StageStats)
+        for (_, path), stats in stages:
+            total = by_stage[path[-1]]
+            total.calls += stats.calls
+            total.wall += stats.wall
+            total.cpu += stats.cpu
+        slowest: dict[str, list[dict]] = defaultdict(list)
+        for (card_type, item), wall in items:
+            if item and len(slowest[card_type]) < SLOWEST_ITEMS:
+                slowest[card_type].append({"item": item, "wall": wall})
+        return {
+            "by_stage": {
+                name: {"calls": s.calls, "wall": s.wall, "cpu": s.cpu}
+                for name, s in sorted(by_stage.items(), key=lambda s: -s[1].wall)
+            },
+            "stages": [
+                {
+                    "card_type": card_type,
+                    "stage": ";".join(path),
+                    "calls": stats.calls,
+                    "wall": stats.wall,
+                    "cpu": stats.cpu,
+                    "self_wall": stats.wall - stats.children_wall,
+                }
+                for (card_type, path), stats in stages
+            ],
+            "slowest_items": slowest,
+        }
+
+    def write_json(self, stream: TextIO):
+        json.dump(self.report(), stream, indent=2, ensure_ascii=False)
+
+    def write_folded(self, stream: TextIO):
+        """Write the self wall time of each stack, in microseconds"""
+        with self.lock:
+            stages = sorted(self.stages.items())
+        for (card_type, path), stats in stages:
+            self_wall = round((stats.wall - stats.children_wall) * 1e6)
+            if self_wall > 0:
+                stream.write(f"{';'.join((card_type,) + path)} {self_wall}\n")
+
+
+def current_rss() -> int:
+    """Return the resident set size of the process, in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """Return the peak resident set size of the process, in bytes"""
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclass
+class MemoryBoundary:
+    """Memory measured at the end of a stage, for a card type"""
+
+    crossings: int = 0
+    max_traced: int = 0
+    max_rss: int = 0
+    # Traced memory when the top allocation sites were last measured
+    snapshot_traced: int = 0
+    top_allocations: list[dict] | None = None
+
+
+class MemoryProfiler(StageProfiler):
+    """Trace the allocations, and snapshot them at the stage boundaries.
+
+    The allocation sites are reported by growth since profiling was enabled,
+    so that the memory allocated at import time doesn't hide the structures
+    built by the run. As stages of different cards run concurrently, the
+    allocations seen at the end of a stage also include the ones of the
+    stages running in other threads.
+
+    Grouping the traces of a snapshot by allocation site is slow, so the top
+    sites measured at a boundary are reused by the other boundaries for as
+    long as the traced memory stays within SNAPSHOT_GROWTH of it.
+
+    """
+
+    # Allocations of the profiler and of the import system
+    ignored_files = {
+        tracemalloc.__file__,
+        "<frozen importlib._bootstrap>",
+        "<frozen importlib._bootstrap_external>",
+        "<unknown>",
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.boundaries: dict[tuple[str, str], MemoryBoundary] = defaultdict(
+            MemoryBoundary
+        )
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.baseline = {
+            self.site(stat): (stat.size, stat.count)
+            for stat in tracemalloc.take_snapshot().statistics("lineno")
+        }
+        self.last_traced = 0
+        self.last_top_allocations: list[dict] | None = None
+
+    @staticmethod
+    def site(stat: tracemalloc.Statistic) -> str:
+        frame = stat.traceback[0]
+        return f"{frame.filename}:{frame.lineno}"
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        with super().stage(name):
+            yield
+        if name in MEMORY_BOUNDARIES:
+            self.boundary(_context.get().card_type, name)
+
+    def boundary(self, card_type: str, stage: str):
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = current_rss()
+        with self.lock:
+            boundary = self.boundaries[(card_type, stage)]
+            boundary.crossings += 1
+            boundary.max_traced = max(boundary.max_traced, traced)
+            boundary.max_rss = max(boundary.max_rss, rss)
+            if boundary.top_allocations is None or (
+                traced >= boundary.snapshot_traced * SNAPSHOT_GROWTH
+            ):
+                boundary.snapshot_traced = traced
+                boundary.top_allocations = self.top_allocations(traced)
+
+    def top_allocations(self, traced: int) -> list[dict]:
+        """Return the allocation sites which grew the most since the baseline"""
+        if (
+            self.last_top_allocations is not None
+            and self.last_traced / SNAPSHOT_GROWTH
+            <= traced
+            <= self.last_traced * SNAPSHOT_GROWTH
+        ):
+            return self.last_top_allocations
+        allocations = []
+        for stat in tracemalloc.take_snapshot().statistics("lineno"):
+            if stat.traceback[0].filename in self.ignored_files:
+                continue
+            site = self.site(stat)
+            size, count = self.baseline.get(site, (0, 0))
+            if stat.size > size:
+                allocations.append(
+                    {
+                        "site": site,
+                        "size": stat.size - size,
+                        "count": stat.count - count,
+                    }
+                )
+        allocations.sort(key=lambda allocation: -allocation["size"])
+        self.last_traced = traced
+        self.last_top_allocations = allocations[:TOP_ALLOCATION_SITES]
+        return self.last_top_allocations
+
+    def report(self) -> dict[str, Any]:
+        with self.lock:
+            boundaries = sorted(self.boundaries.items())
+        card_types: dict[str, dict] = {}
+        for (card_type, stage), boundary in boundaries:
+            report = card_types.setdefault(card_type, {"peak_rss": 0, "stages": {}})
+            report["peak_rss"] = max(report["peak_rss"], boundary.max_rss)
+            report["stages"][stage] = {
+                "crossings": boundary.crossings,
+                "max_traced": boundary.max_traced,
+                "max_rss": boundary.max_rss,
+                "top_allocations": boundary.top_allocations or [],
+            }
+        _, peak_traced = tracemalloc.get_traced_memory()
+        return {
+            "peak_rss": peak_rss(),
+            "peak_traced": peak_traced,
+            "card_types": card_types,
+        }
+
+    def write_folded(self, stream: TextIO):
+        """Write the growth of each allocation site at each stage boundary, in bytes"""
+        with self.lock:
+            boundaries = sorted(self.boundaries.items())
+        for (card_type, stage), boundary in boundaries:
+            for allocation in boundary.top_allocations or []:
+                site = allocation["site"].replace(";", ":")
+                stream.write(f"{card_type};{stage};{site} {allocation['size']}\n")
+
+
+_profiler: StageProfiler | None = None
+_noop = contextlib.nullcontext()
+
+
+def enable_profiling(memory: bool = False) -> StageProfiler:
+    """Enable the stage profiler, or the memory profiler if memory=True"""
+    global _profiler
+    if _profiler is None:
+        _profiler = MemoryProfiler() if memory else StageProfiler()
+    return _profiler
+
+
+def get_profiler() -> StageProfiler | None:
+    return _profiler
+
+
+def profile_stage(name: str) -> ContextManager[None]:
+    """Time the stage when profiling is enabled"""
+    if _profiler is None:
+        return _noop
+    return _profiler.stage(name)
+
+
+def profile_item(scraper) -> ContextManager[None]:
+    """Attribute the stages run within the context to the card of the scraper"""
+    if _profiler is None:
+        return _noop
+    return _profiler.item(scraper)
+
+
+def profiled(name: str) -> Callable[[F], F]:
+    """Decorate a function, so that each of its calls is timed as a stage"""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
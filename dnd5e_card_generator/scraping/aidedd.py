@@ -1,16 +1,12 @@
 import re
-import tempfile
+import sys
 from dataclasses import dataclass
 from functools import cached_property
-from pathlib import Path
 from typing import Optional, cast
-from urllib.parse import parse_qs, urlparse
 
-import requests
 from bs4 import BeautifulSoup
 from bs4.element import NavigableString, Tag
 
-from dnd5e_card_generator.config import Config
 from dnd5e_card_generator.const import (
     AIDEDD_BACKGROUND_URL,
     AIDEDD_CLASS_RULES_URL,
@@ -18,7 +14,6 @@ from dnd5e_card_generator.const import (
     AIDEDD_FEATS_ITEMS_URL,
     AIDEDD_MAGIC_ITEMS_URL,
     AIDEDD_RACE_RULES_URL,
-    AIDEDD_SPELLS_FILTER_URL,
     AIDEDD_SPELLS_URL,
     AIDEDD_UNEARTHED_ARCANA_URL,
     FIVE_E_SHEETS_SPELLS,
@@ -39,12 +34,30 @@ from dnd5e_card_generator.models import (
     MagicSchool,
     SpellShape,
 )
-from dnd5e_card_generator.utils import human_readable_class_name, slugify
+from dnd5e_card_generator.profiling import profile_item
+from dnd5e_card_generator.scraping.cache import cache_key
+from dnd5e_card_generator.scraping.fetch import fetch_page
+from dnd5e_card_generator.scraping.page import ParsedPage, Section, parse_html
+from dnd5e_card_generator.scraping.registry import PageRegistry
+from dnd5e_card_generator.scraping.text import TextExtractor
+from dnd5e_card_generator.utils import human_readable_class_name
 
 
 class ScrapingError(Exception): ...
 
 
+class PageNotFound(ScrapingError):
+    """The page of the element has no content"""
+
+
+class ElementNotFound(ScrapingError):
+    """A part of the page the card is scraped from is missing"""
+
+
+class InvalidElement(ScrapingError):
+    """The element to export can't be scraped, whatever the page"""
+
+
 @dataclass
 class SpellFilter:
     lang: str
@@ -52,135 +65,117 @@ class SpellFilter:
     min_level: int
     max_level: int
 
-    @property
-    def class_name_synonyms(self):
-        return {
-            "artificer": "a",
-            "artificier": "a",
-            "bard": "b",
-            "barde": "b",
-            "cleric": "c",
-            "clerc": "c",
-            "druid": "d",
-            "druide": "d",
-            "sorcerer": "s",
-            "ensorceleur": "s",
-            "wizard": "w",
-            "magicien": "w",
-            "warlock": "k",
-            "occultiste": "k",
-            "paladin": "p",
-            "ranger": "r",
-            "rodeur": "r",
-        }
-
-    def request(self) -> requests.Response:
-        resp = requests.post(
-            AIDEDD_SPELLS_FILTER_URL,
-            headers={
-                "Accept-Encoding": "gzip, deflate, br",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            data={
-                "Filtre1[]": [self.class_name_synonyms[self.class_name]],
-                "nivMin": self.min_level,
-                "nivMax": self.max_level,
-                "source[]": ["base", "xgte", "tcoe", "ftod"],
-                "opt_tcoe": "S",
-                "colE": "on",
-                "colI": "on",
-                "colC": "on",
-                "colR": "on",
-                "colVO": "on",
-                "filtrer": "FILTRER",
-            },
-        )
-        resp.raise_for_status()
-        return resp
+    # Codes of the spellcasting classes in the aidedd spell tables
+    class_name_synonyms = {
+        "artificer": "a",
+        "artificier": "a",
+        "bard": "b",
+        "barde": "b",
+        "cleric": "c",
+        "clerc": "c",
+        "druid": "d",
+        "druide": "d",
+        "sorcerer": "s",
+        "ensorceleur": "s",
+        "wizard": "w",
+        "magicien": "w",
+        "warlock": "k",
+        "occultiste": "k",
+        "paladin": "p",
+        "ranger": "r",
+        "rodeur": "r",
+    }
 
-    def resolve(self) -> list[str]:
-        out = []
-        resp = self.request()
-        soup = BeautifulSoup(resp.text, features="html.parser")
-        table = soup.find("table")
-        if not table:
-            raise ScrapingError("no table found in page")
-        table = cast(Tag, table)
-        spell_rows = table.find_all("tr") or []
-        for spell_row in spell_rows[1:]:  # skip headers
-            if self.lang == "fr":
-                link = spell_row.find("a")
-                query = parse_qs(urlparse(link.attrs["href"]).query)
-                out.append(f"{self.lang}:{query['vf'][0]}")
-            elif self.lang == "en":
-                en_title = cast(Tag, spell_row.find("td", class_="colVO")).text
-                en_slug = slugify(en_title)
-                out.append(f"{self.lang}:{en_slug}")
-        return out
+    @property
+    def class_code(self) -> str:
+        """Return the code of the class in the aidedd spell tables"""
+        try:
+            return self.class_name_synonyms[self.class_name.lower()]
+        except KeyError:
+            raise InvalidElement(f"Unknown spellcasting class {self.class_name}")
 
 
 class BaseAideDDScraper:
     model = None
     model_url: str = ""
+    # Offline scrapers build their model without fetching any page
+    offline = False
     tags_to_unwrap_from_description = ["a", "em", "ul", "li", "strong"]
 
     def __init__(self, slug: str, lang: Language):
         self.slug = slug
         self.lang = lang
-        self.soup, self.div_content = self.parse_page()
+        # The page HTML can be injected by an external fetch engine before
+        # scraping, in which case no HTTP request will be issued by the scraper.
+        self.html: str | None = None
+        # When set, the parsed page is shared with every other scraper of the run
+        # targeting the same URL.
+        self.page_registry: PageRegistry | None = None
 
     @property
     def base_url(self) -> str:
         return self.model_url
 
-    def fetch_data(self):
-        cached_file = Path(f"{tempfile.gettempdir()}/{self.lang}:{self.slug}.html")
-        if cached_file.exists() and not Config.BYPASS_CACHE:
-            return cached_file.read_text()
+    @property
+    def query_params(self) -> dict[str, str]:
         lang_param = "vf" if self.lang == "fr" else "vo"
-        resp = requests.get(self.base_url, params={lang_param: self.slug})
-        resp.raise_for_status()
-        cached_file.write_text(resp.text)
-        return resp.text
+        return {lang_param: self.slug}
+
+    def fetch_data(self) -> str:
+        if self.html is not None:
+            return self.html
+        with profile_item(self):
+            return fetch_page(self.base_url, params=self.query_params)
+
+    @property
+    def page_key(self) -> str:
+        return cache_key(self.base_url, self.query_params)
+
+    @property
+    def item_key(self) -> str:
+        """Identify the scraped item among the ones sharing the same page"""
+        return self.slug
+
+    @cached_property
+    def page(self) -> ParsedPage:
+        if self.page_registry is None:
+            return self.parse_page()
+        return self.page_registry.get_or_load(self.page_key, self.parse_page)
+
+    def release(self):
+        """Drop the page HTML and parsed document, once the model is scraped.
+
+        A parsed page weighs tens of times its HTML, and would otherwise be kept
+        alive for as long as the scraper is.
 
-    def parse_page(self) -> tuple[BeautifulSoup, Tag]:
+        """
+        self.html = None
+        self.__dict__.pop("page", None)
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        return self.page.soup
+
+    @property
+    def div_content(self) -> Tag:
+        return self.page.div_content
+
+    def parse_page(self) -> ParsedPage:
         html = self.fetch_data()
-        soup = BeautifulSoup(html, features="html.parser")
+        soup = parse_html(html, partial=True)
         div_content = soup.find("div", class_="col1") or soup.find(
             "div", class_="content"
         )
         if div_content is None:
-            raise ScrapingError(f"{self.slug} not found!")
-        return soup, cast(Tag, div_content)
-
-    def sanitize_soup(self, soup: BeautifulSoup | Tag) -> BeautifulSoup:
-        """Remove formatting tags form soup to avoid whitespace issues when extracting the text content"""
-        for tag_type in self.tags_to_unwrap_from_description:
-            for tag in soup.find_all(tag_type):
-                if tag.name == "li":
-                    if tag.string is None:
-                        tag.string = tag.text
-                    # This will help us later on to re-render the li bullet in the card
-                    tag.string = "• " + tag.string
-                    continue
-                elif tag.name == "em":
-                    tag.string = f"_{tag.string}_"
-                elif tag.name == "strong":
-                    tag.string = f"*{tag.string}*"
-                tag.unwrap()
-
-        # Hack, cf https://stackoverflow.com/questions/44679677/get-real-text-with-beautifulsoup-after-unwrap
-        string_soup = str(soup)
-        new_soup = BeautifulSoup(string_soup, features="html.parser")
-        return new_soup
+            raise PageNotFound(f"{self.slug} not found!")
+        return ParsedPage(soup, cast(Tag, div_content))
 
     def _find_in_tag(
         self, tag: Tag | NavigableString | BeautifulSoup, *args, **kwargs
     ) -> Tag:
         match = tag.find(*args, **kwargs)
         if not match:
-            raise ScrapingError(
+            raise ElementNotFound(
                 f"No match were found for {args}, {kwargs} ({self.slug})"
             )
         return cast(Tag, match)
@@ -194,8 +189,7 @@ class BaseAideDDScraper:
     def scrape_text_block(self, tag: Tag) -> list[str]:
         if tag.name == "table":
             return [str(tag)]
-        desc_div = self.sanitize_soup(tag)
-        return list(desc_div.strings)
+        return TextExtractor(self.tags_to_unwrap_from_description).extract(tag)
 
     def scrape_title(self) -> str:
         return self.find_in_soup("h1").text.strip()
@@ -205,7 +199,7 @@ class BaseAideDDScraper:
             return self.scrape_title()
         en_link = self.find_in_content("div", class_="trad").find("a")
         if not en_link:
-            raise ScrapingError("No english link found")
+            raise ElementNotFound("No english link found")
         en_link = cast(Tag, en_link)
         return en_link.text
 
@@ -221,7 +215,8 @@ class BaseItemPageScraper(BaseAideDDScraper):
 class TitleDescriptionPrerequisiteScraper(BaseItemPageScraper):
     def scrape(self):
         print(
-            f"Scraping data for {human_readable_class_name(self.model.__name__)} {self.slug}"  # pyright: ignore
+            f"Scraping data for {human_readable_class_name(self.model.__name__)} {self.slug}",  # pyright: ignore
+            file=sys.stderr,
         )
         prerequisite_div = self.div_content.find("div", class_="prerequis")
         return self.model(  # pyright: ignore
@@ -233,6 +228,7 @@ class TitleDescriptionPrerequisiteScraper(BaseItemPageScraper):
 
 
 class SpellScraper(BaseItemPageScraper):
+    model = Spell
     model_url = AIDEDD_SPELLS_URL
     # We surround these indicators with underscores as the text appears in italics
     # in the text, and this is our way to signal the card formatter to display this
@@ -317,15 +313,12 @@ class SpellScraper(BaseItemPageScraper):
         return [d.text for d in self.div_content.find_all("div", class_="classe")]
 
     def scrape_spell_shape(self) -> Optional[SpellShape]:
-        area_tags = self.five_e_sheets_spell.get("area_tags", [])
-        area_tags = [tag for tag in area_tags if tag not in ["ST", "MT"]]
-        if area_tags:
-            # If several shapes are found, we randomly pick the first one
-            return SpellShape.from_5esheet_tag(area_tags[0])
-        return None
+        return SpellShape.from_5esheet_area_tags(
+            self.five_e_sheets_spell.get("area_tags", [])
+        )
 
     def scrape(self) -> Spell:
-        print(f"Scraping data for spell {self.slug}")
+        print(f"Scraping data for spell {self.slug}", file=sys.stderr)
         spell_text, upcasting_text = self.scrape_spell_texts()
         school_text = self.scrape_school_text()
 
@@ -414,6 +407,7 @@ class SpellScraper(BaseItemPageScraper):
 
 
 class MagicItemScraper(BaseItemPageScraper):
+    model = MagicItem
     model_url = AIDEDD_MAGIC_ITEMS_URL
 
     attunement_text_by_lang = {
@@ -422,7 +416,7 @@ class MagicItemScraper(BaseItemPageScraper):
     }
 
     def scrape(self) -> MagicItem:
-        print(f"Scraping data for item {self.slug}")
+        print(f"Scraping data for item {self.slug}", file=sys.stderr)
 
         attunement_text = self.attunement_text_by_lang[self.lang]
         item_type_div_text = self.find_in_content("div", class_="type").text
@@ -475,6 +469,7 @@ class EldrichInvocationScraper(TitleDescriptionPrerequisiteScraper):
 
 
 class CharacterClassFeatureScraper(BaseAideDDScraper):
+    model = ClassFeature
     class_variant_indicator = {
         CharacterClass.artificer: "Spécialité",
         CharacterClass.barbarian: "Voie",
@@ -496,6 +491,11 @@ class CharacterClassFeatureScraper(BaseAideDDScraper):
         self.title = title
         super().__init__(slug=title, lang=lang)
 
+    @property
+    def query_params(self) -> dict[str, str]:
+        # The page is identified by its path, and shared by all the class features
+        return {}
+
     @property
     def base_url(self) -> str:
         if self.class_name == CharacterClass.artificer:
@@ -506,52 +506,34 @@ class CharacterClassFeatureScraper(BaseAideDDScraper):
             class_=self.class_name.translate(self.lang)
         )
 
-    def find_feature_section(self) -> Tag:
-        for tag in self.soup.find_all(["h3", "h4"]):
-            if tag.text == self.title:
-                break
-        else:
-            raise ScrapingError(f"Class feature {self.title} not found")
-        return tag
+    def find_feature_section(self) -> Section:
+        if (section := self.page.sections_by_title.get(self.title)) is None:
+            raise ElementNotFound(f"Class feature {self.title} not found")
+        return section
 
     def scrape_text(self) -> list[str]:
-        tag = self.find_feature_section()
-        accumulator, found_tag = [], False
-        for t in self.soup.find_all():
-            if t == tag:
-                found_tag = True
-                continue
-            if t.name == "p" and found_tag:
-                accumulator.append(self.sanitize_soup(t))
-            elif t.name == "table" and found_tag:
+        section = self.find_feature_section()
+        accumulator = []
+        for t in section.elements:
+            if t.name == "p":
+                accumulator.append(t)
+            elif t.name == "table":
                 accumulator.append(t)
-            elif t.name in ["h2", "h3", "h4"] and found_tag:
-                break
         out = []
         for tag in accumulator:
             out.extend(self.scrape_text_block(tag))
         return out
 
     def scrape_class_variant(self) -> str | None:
-        tag = self.find_feature_section()
-        last_seen_h2: Tag | None = None
-        last_seen_h3: Tag | None = None
-        for t in cast(list[Tag], self.soup.find_all(["h2", "h3", tag.name])):
-            if t == tag and last_seen_h2 is not None and last_seen_h3 is not None:
-                if last_seen_h2.text.startswith(
-                    self.class_variant_indicator[self.class_name]
-                ):
-                    return last_seen_h3.text
-                else:
-                    return
-            elif t.name == "h2":
-                last_seen_h2 = t
-            elif t.name == "h3":
-                last_seen_h3 = t
-        return
+        section = self.find_feature_section()
+        if section.h2 is None or section.h3 is None:
+            return None
+        if section.h2.text.startswith(self.class_variant_indicator[self.class_name]):
+            return section.h3.text
+        return None
 
     def scrape(self) -> ClassFeature:
-        print(f"Scraping data for class feature {self.title}")
+        print(f"Scraping data for class feature {self.title}", file=sys.stderr)
         text = self.scrape_text()
         class_variant = self.scrape_class_variant()
         return ClassFeature(
@@ -572,43 +554,43 @@ class AncestryFeatureScraper(BaseAideDDScraper):
         self.sub_ancestry = sub_ancestry
         super().__init__(slug=ancestry, lang=lang)
 
+    @property
+    def item_key(self) -> str:
+        return f"{self.ancestry}/{self.sub_ancestry}"
+
+    @property
+    def query_params(self) -> dict[str, str]:
+        return {}
+
     @property
     def base_url(self) -> str:
         return AIDEDD_RACE_RULES_URL[self.lang].format(ancestry=self.ancestry)
 
-    def find_feature_section(self) -> Tag:
+    def find_feature_section(self) -> Section:
         if self.sub_ancestry:
-            for tag in self.soup.find_all(["h4"]):
-                if tag.text.replace("’", "'").endswith(self.sub_ancestry):
-                    break
-            else:
-                raise ScrapingError(f"Ancestry feature {self.sub_ancestry} not found")
-        else:
-            for tag in self.soup.find_all(["h3", "h4"]):
-                if tag.text.endswith(self.title_indicator):
-                    break
-            else:
-                raise ScrapingError(f"Ancestry feature {self.ancestry} not found")
-        return tag
+            for section in self.page.sections:
+                if section.heading.name == "h4" and section.title.replace(
+                    "’", "'"
+                ).endswith(self.sub_ancestry):
+                    return section
+            raise ElementNotFound(f"Ancestry feature {self.sub_ancestry} not found")
+        for section in self.page.sections:
+            if section.title.endswith(self.title_indicator):
+                return section
+        raise ElementNotFound(f"Ancestry feature {self.ancestry} not found")
 
     def scrape_text(self) -> list[str]:
-        tag = self.find_feature_section()
-        accumulator, found_tag = [], False
-        for t in self.soup.find_all():
-            if t == tag:
-                found_tag = True
-                continue
+        section = self.find_feature_section()
+        accumulator = []
+        for t in section.elements:
             if (
                 t.name == "p"
-                and found_tag
                 and "encadre" not in t.attrs.get("class", {})
                 and not t.text.startswith("Sous-race.")
             ):
-                accumulator.append(self.sanitize_soup(t))
-            elif t.name == "table" and found_tag:
                 accumulator.append(t)
-            elif t.name in ["h2", "h3", "h4"] and found_tag:
-                break
+            elif t.name == "table":
+                accumulator.append(t)
         out = []
         for tag in accumulator:
             out.extend(self.scrape_text_block(tag))
@@ -617,7 +599,8 @@ class AncestryFeatureScraper(BaseAideDDScraper):
 
     def scrape(self) -> AncestryFeature:
         print(
-            f"Scraping data for ancestry feature {self.sub_ancestry or self.ancestry}"
+            f"Scraping data for ancestry feature {self.sub_ancestry or self.ancestry}",
+            file=sys.stderr,
         )
         return AncestryFeature(
             title=self.scrape_title(),
@@ -631,6 +614,10 @@ class BackgroundScraper(BaseAideDDScraper):
     model = Background
     marker = {"fr": "Capacité", "en": "Feature"}
 
+    @property
+    def query_params(self) -> dict[str, str]:
+        return {}
+
     @property
     def base_url(self) -> str:
         return AIDEDD_BACKGROUND_URL[self.lang].format(background=self.slug)
@@ -654,7 +641,7 @@ class BackgroundScraper(BaseAideDDScraper):
         return []
 
     def scrape(self) -> Background:
-        print(f"Scraping data for background {self.slug}")
+        print(f"Scraping data for background {self.slug}", file=sys.stderr)
         return Background(
             title=self.scrape_title(),
             text=self.scrape_text(),
@@ -0,0 +1,235 @@
+"""Record the HTTP requests of a run into an archive, and replay them.
+
+In record mode, every request sent by the requests session or the asyncio
+engine is stored, along with its response, in a single HTTP archive (HAR 1.2)
+file, written at the end of the run. In replay mode, the responses are served
+from the archive, without any network access, optionally after an injected
+latency. A request missing from the archive fails with ReplayMiss.
+
+    dnd5e-card-generator --record-http run.har ...
+    dnd5e-card-generator --replay-http run.har --replay-latency 0.05 ...
+
+The page and model caches are bypassed in both modes, so that every request
+of the run is recorded, and every page is scraped again when replayed.
+
+"""
+
+import argparse
+import atexit
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from dnd5e_card_generator.config import Config
+
+RECORD = "record"
+REPLAY = "replay"
+# Headers describing the encoding of the body on the wire, which doesn't apply
+# to the decoded body stored in the archive
+WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class ReplayMiss(Exception): ...
+
+
+def request_key(
+    method: str, url: str, params: Mapping | None = None, body: str | None = None
+) -> str:
+    """Identify a request, whether its query parameters are part of the URL or not"""
+    split = urlsplit(url)
+    query = parse_qsl(split.query, keep_blank_values=True)
+    query.extend((str(k), str(v)) for k, v in (params or {}).items())
+    url = f"{split.scheme}://{split.netloc}{split.path}?{urlencode(sorted(query))}"
+    return f"{method.upper()} {url} {body or ''}".rstrip()
+
+
+@dataclass
+class ArchivedResponse:
+    status: int
+    reason: str
+    headers: dict[str, str]
+    text: str
+    # Time the request took when recorded, in seconds
+    elapsed: float
+
+
+class HTTPArchive:
+    def __init__(self, path: Path, mode: str, latency: float | str | None = None):
+        self.path = path
+        self.mode = mode
+        # Latency injected before serving a replayed response: a number of
+        # seconds, or "recorded" to replay the latency of the recorded request
+        self.latency = latency
+        self.entries: list[dict] = []
+        self.responses: dict[str, ArchivedResponse] = {}
+        self.lock = threading.Lock()
+        if mode == REPLAY:
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            self.entries = json.load(f)["log"]["entries"]
+        for entry in self.entries:
+            request, response = entry["request"], entry["response"]
+            key = request_key(
+                request["method"],
+                request["url"],
+                body=request.get("postData", {}).get("text"),
+            )
+            self.responses[key] = ArchivedResponse(
+                status=response["status"],
+                reason=response["statusText"],
+                headers={h["name"]: h["value"] for h in response["headers"]},
+                text=response["content"].get("text", ""),
+                elapsed=entry["time"] / 1000,
+            )
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            entries = list(self.entries)
+        with open(self.path, "w") as f:
+            json.dump(
+                {
+                    "log": {
+                        "version": "1.2",
+                        "creator": {"name": "dnd5e-card-generator", "version": "0.1.0"},
+                        "entries": entries,
+                    }
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+    def record(
+        self,
+        method: str,
+        url: str,
+        params: Mapping | None,
+        body: str | None,
+        response: ArchivedResponse,
+    ):
+        split = urlsplit(request_key(method, url, params).split(" ")[1])
+        request: dict = {
+            "method": method.upper(),
+            "url": split.geturl(),
+            "httpVersion": "HTTP/1.1",
+            "headers": [],
+            "queryString": [{"name": k, "value": v} for k, v in parse_qsl(split.query)],
+            "cookies": [],
+            "headersSize": -1,
+            "bodySize": len(body or ""),
+        }
+        if body:
+            request["postData"] = {
+                "mimeType": "application/x-www-form-urlencoded",
+                "text": body,
+            }
+        headers = {
+            k: v for k, v in response.headers.items() if k.lower() not in WIRE_HEADERS
+        }
+        entry = {
+            "startedDateTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "time": round(response.elapsed * 1000, 3),
+            "request": request,
+            "response": {
+                "status": response.status,
+                "statusText": response.reason,
+                "httpVersion": "HTTP/1.1",
+                "headers": [{"name": k, "value": v} for k, v in headers.items()],
+                "cookies": [],
+                "content": {
+                    "size": len(response.text),
+                    "mimeType": headers.get("Content-Type", "text/html"),
+                    "text": response.text,
+                },
+                "redirectURL": headers.get("Location", ""),
+                "headersSize": -1,
+                "bodySize": -1,
+            },
+            "cache": {},
+            "timings": {
+                "send": 0,
+                "wait": round(response.elapsed * 1000, 3),
+                "receive": 0,
+            },
+        }
+        with self.lock:
+            self.entries.append(entry)
+
+    def replay_delay(self, response: ArchivedResponse) -> float:
+        if self.latency == "recorded":
+            return response.elapsed
+        return float(self.latency or 0)
+
+    def lookup(
+        self, method: str, url: str, params: Mapping | None, body: str | None
+    ) -> ArchivedResponse:
+        key = request_key(method, url, params, body)
+        if (response := self.responses.get(key)) is None:
+            raise ReplayMiss(f"{key} not found in {self.path}")
+        return response
+
+
+_archive: HTTPArchive | None = None
+_archive_lock = threading.Lock()
+
+
+def get_http_archive() -> HTTPArchive | None:
+    """Return the process-wide HTTP archive, or None if requests are neither recorded nor replayed"""
+    global _archive
+    if Config.HTTP_ARCHIVE is None:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = HTTPArchive(
+                Path(Config.HTTP_ARCHIVE),
+                mode=Config.HTTP_ARCHIVE_MODE,
+                latency=Config.REPLAY_LATENCY,
+            )
+            if _archive.mode == RECORD:
+                atexit.register(_archive.save)
+        return _archive
+
+
+def replay_latency(value: str) -> float | str:
+    return value if value == "recorded" else float(value)
+
+
+def add_http_archive_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--record-http",
+        type=Path,
+        metavar="ARCHIVE",
+        help="Record every HTTP request and response of the run into an HTTP archive (HAR) file",
+    )
+    group.add_argument(
+        "--replay-http",
+        type=Path,
+        metavar="ARCHIVE",
+        help="Serve every HTTP response from an archive written by --record-http, without network",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=replay_latency,
+        help=(
+            "Latency injected before serving each replayed response, in seconds, or\n"
+            "'recorded' to replay the recorded latencies (default: 0)"
+        ),
+    )
+
+
+def configure_http_archive(args: argparse.Namespace):
+    if args.record_http:
+        Config.HTTP_ARCHIVE, Config.HTTP_ARCHIVE_MODE = args.record_http, RECORD
+    elif args.replay_http:
+        Config.HTTP_ARCHIVE, Config.HTTP_ARCHIVE_MODE = args.replay_http, REPLAY
+    else:
+        return
+    Config.REPLAY_LATENCY = args.replay_latency
+    Config.BYPASS_CACHE = True
@@ -0,0 +1,288 @@
+"""Asyncio alternative to the thread pool, to fetch hundreds of pages concurrently.
+
+aiohttp is an optional dependency, installed with the `async` extra.
+
+"""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Mapping
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.metrics import (
+    PAGE_CACHE_REQUESTS,
+    card_type,
+    record_http_response,
+    record_http_retry,
+    record_scrape_failure,
+)
+from dnd5e_card_generator.profiling import profile_item, profile_stage
+from dnd5e_card_generator.scraping.archive import (
+    REPLAY,
+    ArchivedResponse,
+    get_http_archive,
+)
+from dnd5e_card_generator.scraping.fetch import (
+    cached_entry,
+    is_fresh,
+    snapshot_html,
+    store_response,
+)
+from dnd5e_card_generator.scraping.hedging import get_hedger
+from dnd5e_card_generator.scraping.model_cache import cached_scrape
+from dnd5e_card_generator.scraping.policy import (
+    RETRY_STATUSES,
+    HostPolicy,
+    get_request_policy,
+)
+from dnd5e_card_generator.scraping.registry import PageRegistry
+from dnd5e_card_generator.scraping.session import CONNECTION_STATS
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from dnd5e_card_generator.scraping.aidedd import BaseAideDDScraper
+
+
+def aiohttp_available() -> bool:
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _connection_stats_trace_config() -> "aiohttp.TraceConfig":
+    import aiohttp
+
+    async def on_request_start(*_):
+        CONNECTION_STATS.record_request()
+
+    async def on_connection_create_end(*_):
+        CONNECTION_STATS.record_connection()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+class AsyncScrapingEngine:
+    """Fetch scraper pages concurrently, with at most `concurrency` requests in flight.
+
+    The engine is an async context manager owning the aiohttp session, so that
+    a single connection pool can be shared by all the card categories of a run:
+
+        async with AsyncScrapingEngine(concurrency=50) as engine:
+            models = await engine.scrape_all(scrapers)
+
+    """
+
+    def __init__(self, concurrency: int | None = None):
+        self.concurrency = concurrency or Config.MAX_WORKERS
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session: "aiohttp.ClientSession | None" = None
+        # Pages are downloaded and parsed once per engine, however many scrapers
+        # target them, and are discarded once every scraper expected to target
+        # them is done, so that the memory doesn't grow with the number of pages.
+        self.downloads: dict[str, asyncio.Task[str]] = {}
+        self.page_registry = PageRegistry()
+        self.expected_scrapers: dict[str, int] = {}
+
+    async def __aenter__(self) -> "AsyncScrapingEngine":
+        import aiohttp
+
+        connect_timeout, read_timeout = Config.HTTP_TIMEOUT
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=connect_timeout, sock_read=read_timeout
+            ),
+            trace_configs=[_connection_stats_trace_config()],
+        )
+        return self
+
+    async def __aexit__(self, *_):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, scraper: "BaseAideDDScraper") -> str:
+        if scraper.html is None:
+            if (download := self.downloads.get(scraper.page_key)) is None:
+                download = self.downloads[scraper.page_key] = asyncio.create_task(
+                    self.download(scraper.base_url, scraper.query_params)
+                )
+            scraper.html = await download
+        return scraper.html
+
+    async def download(self, url: str, params: dict) -> str:
+        with profile_stage("fetch"):
+            return await self._download(url, params)
+
+    async def _download(self, url: str, params: dict) -> str:
+        if (html := await asyncio.to_thread(snapshot_html, url, params)) is not None:
+            PAGE_CACHE_REQUESTS.inc(result="snapshot")
+            return html
+        entry = await asyncio.to_thread(cached_entry, url, params)
+        if entry is not None and is_fresh(entry):
+            PAGE_CACHE_REQUESTS.inc(result="hit")
+            html = entry.html
+        else:
+            if self.session is None:
+                raise RuntimeError(
+                    "AsyncScrapingEngine must be used as a context manager"
+                )
+            headers = entry.validator_headers() if entry else {}
+            with profile_stage("network"):
+                status, text, resp_headers = await self.get(url, params, headers)
+            html = await asyncio.to_thread(
+                store_response, url, params, entry, status, text, resp_headers
+            )
+        return html
+
+    async def get(
+        self, url: str, params: dict, headers: dict
+    ) -> tuple[int, str, Mapping[str, str]]:
+        """Send a GET request through the request policy of the host.
+
+        Requests failing with 429/5xx or a connection error are retried, and
+        an error is raised once out of retries. When hedging is enabled, each
+        attempt is hedged once it holds its host slot.
+
+        """
+        import aiohttp
+
+        archive = get_http_archive()
+        if archive is not None and archive.mode == REPLAY:
+            archived = archive.lookup("GET", url, params, None)
+            delay = archive.replay_delay(archived)
+            await asyncio.sleep(delay)
+            record_http_response(
+                url, archived.status, delay, len(archived.text.encode())
+            )
+            return archived.status, archived.text, archived.headers
+        assert self.session is not None
+        policy = get_request_policy()
+        host = policy.host(url)
+        hedger = get_hedger()
+        deadline = policy.request_deadline()
+        attempt = 0
+        while True:
+            resp, error, body = None, None, b""
+            async with self.semaphore, host.aslot() as outcome:
+                try:
+                    if hedger is not None:
+                        resp, body, elapsed = await hedger.arun(
+                            lambda: self.exchange(url, params, headers),
+                            hedge=lambda: self.slotted_exchange(
+                                host, url, params, headers
+                            ),
+                        )
+                    else:
+                        resp, body, elapsed = await self.exchange(url, params, headers)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                    error = exc
+                outcome.record(resp.status if resp is not None else None)
+            delay = policy.retry_delay(
+                attempt,
+                resp.status if resp is not None else None,
+                resp.headers if resp is not None else {},
+                deadline,
+            )
+            if delay is None:
+                if error is not None:
+                    raise error
+                # Either successful, or out of retries
+                resp.raise_for_status()  # pyright: ignore
+                text = body.decode(resp.get_encoding())  # pyright: ignore
+                if archive is not None:
+                    archive.record(
+                        "GET",
+                        url,
+                        params,
+                        None,
+                        ArchivedResponse(
+                            status=resp.status,  # pyright: ignore
+                            reason=resp.reason or "",  # pyright: ignore
+                            headers=dict(resp.headers),  # pyright: ignore
+                            text=text,
+                            elapsed=elapsed,
+                        ),
+                    )
+                return resp.status, text, resp.headers  # pyright: ignore
+            record_http_retry(url)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def exchange(
+        self, url: str, params: dict, headers: dict
+    ) -> tuple["aiohttp.ClientResponse", bytes, float]:
+        """Send the request once, and return the response, its body and its latency"""
+        import aiohttp
+
+        assert self.session is not None
+        start = time.monotonic()
+        try:
+            async with self.session.get(url, params=params, headers=headers) as resp:
+                body = b"" if resp.status in RETRY_STATUSES else await resp.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            record_http_response(url, None, time.monotonic() - start)
+            raise
+        elapsed = time.monotonic() - start
+        record_http_response(url, resp.status, elapsed, len(body))
+        hedger = get_hedger()
+        if hedger is not None and resp.status not in RETRY_STATUSES:
+            hedger.observe(elapsed)
+        return resp, body, elapsed
+
+    async def slotted_exchange(
+        self, host: HostPolicy, url: str, params: dict, headers: dict
+    ) -> tuple["aiohttp.ClientResponse", bytes, float]:
+        """Send the request once, within a slot of its own (as a hedge)"""
+        async with self.semaphore, host.aslot() as outcome:
+            resp, body, elapsed = await self.exchange(url, params, headers)
+            outcome.record(resp.status)
+            return resp, body, elapsed
+
+    def expect(self, scrapers: list["BaseAideDDScraper"]):
+        """Keep the pages of the scrapers until they are all scraped"""
+        for scraper in scrapers:
+            if not scraper.offline:
+                key = scraper.page_key
+                self.expected_scrapers[key] = self.expected_scrapers.get(key, 0) + 1
+
+    def release(self, scraper: "BaseAideDDScraper"):
+        key = scraper.page_key
+        if (remaining := self.expected_scrapers.get(key, 0) - 1) > 0:
+            self.expected_scrapers[key] = remaining
+            return
+        self.expected_scrapers.pop(key, None)
+        self.downloads.pop(key, None)
+        self.page_registry.discard(key)
+
+    async def scrape(self, scraper: "BaseAideDDScraper") -> Any:
+        """Return the model of the scraper.
+
+        The page is discarded once scraped, unless other scrapers targeting it
+        were announced with expect().
+
+        """
+        with profile_item(scraper):
+            try:
+                if scraper.offline:
+                    return await asyncio.to_thread(cached_scrape, scraper)
+                if scraper.page_registry is None:
+                    scraper.page_registry = self.page_registry
+                try:
+                    await self.fetch(scraper)
+                    return await asyncio.to_thread(cached_scrape, scraper)
+                finally:
+                    self.release(scraper)
+            except Exception as exc:
+                record_scrape_failure(card_type(scraper), exc)
+                raise
+
+    async def scrape_all(self, scrapers: list["BaseAideDDScraper"]) -> list[Any]:
+        self.expect(scrapers)
+        return await asyncio.gather(*(self.scrape(scraper) for scraper in scrapers))
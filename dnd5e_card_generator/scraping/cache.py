@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlencode
+
+from dnd5e_card_generator.config import Config
+
+
+def cache_key(url: str, params: dict | None = None) -> str:
+    """Return a key identifying the page fetched from the given URL and query parameters"""
+    query = urlencode(sorted((params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    params: dict
+    html: str
+    stored_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def validator_headers(self) -> dict[str, str]:
+        """Return the headers used to revalidate the entry with a conditional request"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """Gzip-compressed HTML page cache, with a TTL and a size budget.
+
+    Each page is stored in its own file, named after the hash of its URL and
+    query parameters, along with its ETag and Last-Modified validators.
+    Entries older than `ttl` seconds are not discarded, but should be
+    revalidated with a conditional request. When the total size of the cache
+    exceeds `max_size` bytes, the least recently used entries are evicted.
+
+    If track_access=False, reading an entry doesn't write anything, so that the
+    cache can be read from a read-only directory.
+
+    """
+
+    suffix = ".html.gz"
+
+    def __init__(
+        self, directory: Path, ttl: float, max_size: int, track_access: bool = True
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.track_access = track_access
+        self.lock = threading.Lock()
+        self._size: int | None = None
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def entries(self) -> list[Path]:
+        return list(self.directory.glob(f"*/*{self.suffix}"))
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self.entries())
+        return self._size
+
+    def read(self, url: str, params: dict | None = None) -> CacheEntry | None:
+        """Return the cached entry for the page, even if it has expired"""
+        path = self.path(cache_key(url, params))
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                metadata = json.loads(f.readline())
+                html = f.read()
+            # Bump the access time, used to evict the least recently used entries
+            if self.track_access:
+                os.utime(path, (time.time(), path.stat().st_mtime))
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+            return None
+        return CacheEntry(html=html, **metadata)
+
+    def get(self, url: str, params: dict | None = None) -> str | None:
+        """Return the cached HTML of the page if it exists and has not expired"""
+        entry = self.read(url, params)
+        if entry is None or entry.age() > self.ttl:
+            return None
+        return entry.html
+
+    def set(
+        self,
+        url: str,
+        params: dict | None,
+        html: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        path = self.path(cache_key(url, params))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        metadata = {
+            "url": url,
+            "params": params or {},
+            "stored_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        # Write to a temporary file first, so that concurrent readers never see a
+        # partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+            f.write(html)
+        with self.lock:
+            # Sized before the replacement, which would otherwise count the new
+            # entry twice when the size is first computed
+            size = self.size
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size = size - previous_size + path.stat().st_size
+            if self._size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in its budget"""
+        stats = []
+        for path in self.entries():
+            try:
+                stats.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        size = sum(stat.st_size for _, stat in stats)
+        for path, stat in sorted(stats, key=lambda item: item[1].st_atime):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+        self._size = size
+
+
+_page_cache: PageCache | None = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Return the process-wide page cache, configured after Config"""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(
+                directory=Path(Config.CACHE_DIR),
+                ttl=Config.CACHE_TTL,
+                max_size=Config.CACHE_MAX_SIZE,
+            )
+        return _page_cache
@@ -0,0 +1,309 @@
+"""Mirror every aidedd page the scrapers can read into a local snapshot.
+
+The crawler starts from the index page of each model URL of const.py, from the
+pages of every known class and ancestry, and from the spells of the spell
+catalogue. It then follows the links of every fetched page that point to a
+page of a scraper, such as the link to the english version of a french page,
+until no new page is found.
+
+    crawl-aidedd --jobs 2 --rate-limit 2
+
+Once complete, the snapshot becomes the latest one, and can be used to
+generate cards without any HTTP request with `--snapshot`.
+
+"""
+
+import argparse
+import concurrent.futures
+import json
+import re
+import shutil
+import sys
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import parse_qs, urldefrag, urlencode, urljoin, urlsplit
+
+# Imported before the scrapers, which import the card formatters of the export
+# package, itself importing the scrapers
+from dnd5e_card_generator import export  # noqa: F401
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.const import (
+    AIDEDD_BACKGROUND_URL,
+    AIDEDD_CLASS_RULES_URL,
+    AIDEDD_ELDRICHT_INVOCATIONS_URL,
+    AIDEDD_FEATS_ITEMS_URL,
+    AIDEDD_MAGIC_ITEMS_URL,
+    AIDEDD_RACE_RULES_URL,
+    AIDEDD_SPELLS_URL,
+    AIDEDD_UNEARTHED_ARCANA_URL,
+)
+from dnd5e_card_generator.models import CharacterAncestry, CharacterClass
+from dnd5e_card_generator.scraping.archive import (
+    add_http_archive_arguments,
+    configure_http_archive,
+)
+from dnd5e_card_generator.scraping.cache import PageCache, cache_key
+from dnd5e_card_generator.scraping.page import parse_html
+from dnd5e_card_generator.scraping.session import get_session
+from dnd5e_card_generator.scraping.snapshot import snapshots_directory
+from dnd5e_card_generator.scraping.spell_catalogue import (
+    CATALOGUE_FILENAME,
+    SpellCatalogue,
+)
+
+# Pages identified by a query parameter: ?vf=<french slug> or ?vo=<english slug>
+QUERY_PAGE_URLS = {
+    "spell": AIDEDD_SPELLS_URL,
+    "magic_item": AIDEDD_MAGIC_ITEMS_URL,
+    "feat": AIDEDD_FEATS_ITEMS_URL,
+    "eldricht_invocation": AIDEDD_ELDRICHT_INVOCATIONS_URL,
+}
+LANG_PARAMS = {"fr": "vf", "en": "vo"}
+
+# Pages identified by their path
+PATH_PAGE_TEMPLATES = {
+    "class": [*AIDEDD_CLASS_RULES_URL.values(), AIDEDD_UNEARTHED_ARCANA_URL],
+    "ancestry": list(AIDEDD_RACE_RULES_URL.values()),
+    "background": list(AIDEDD_BACKGROUND_URL.values()),
+}
+
+
+@dataclass(frozen=True)
+class CrawledPage:
+    kind: str
+    url: str
+    params: tuple[tuple[str, str], ...] = ()
+
+    @property
+    def key(self) -> str:
+        return cache_key(self.url, dict(self.params))
+
+    def __str__(self) -> str:
+        return f"{self.url}?{urlencode(self.params)}" if self.params else self.url
+
+
+class PathTemplate:
+    """Match the URLs of a template with a single placeholder, such as .../{class_}/"""
+
+    def __init__(self, kind: str, template: str):
+        self.kind = kind
+        self.template = template
+        prefix, _, rest = template.partition("{")
+        self.placeholder, _, suffix = rest.partition("}")
+        self.index_url = prefix
+        self.pattern = re.compile(
+            re.escape(prefix)
+            + r"(?P<value>[^/?#]+)"
+            + re.escape(suffix.rstrip("/"))
+            + "/?$"
+        )
+
+    def page(self, value: str) -> CrawledPage:
+        return CrawledPage(self.kind, self.template.format(**{self.placeholder: value}))
+
+    def match(self, url: str) -> CrawledPage | None:
+        if match := self.pattern.match(url):
+            return self.page(match.group("value"))
+        return None
+
+
+PATH_TEMPLATES = [
+    PathTemplate(kind, template)
+    for kind, templates in PATH_PAGE_TEMPLATES.items()
+    for template in templates
+]
+
+
+def canonical_page(href: str, base_url: str) -> CrawledPage | None:
+    """Return the page a link points to, as requested by the scrapers, if any"""
+    url = urldefrag(urljoin(base_url, href)).url
+    split = urlsplit(url)
+    path_url = f"{split.scheme}://{split.netloc}{split.path}"
+    query = parse_qs(split.query)
+    for kind, page_url in QUERY_PAGE_URLS.items():
+        if path_url != page_url:
+            continue
+        for lang_param in LANG_PARAMS.values():
+            if lang_param in query:
+                return CrawledPage(
+                    kind, page_url, ((lang_param, query[lang_param][0]),)
+                )
+        return None
+    for template in PATH_TEMPLATES:
+        if page := template.match(path_url):
+            return page
+    return None
+
+
+def seed_pages(catalogue: SpellCatalogue) -> list[CrawledPage]:
+    """Return the pages from which the crawl starts"""
+    pages = [CrawledPage("index", url) for url in QUERY_PAGE_URLS.values()]
+    pages.extend(
+        CrawledPage("index", template.index_url) for template in PATH_TEMPLATES
+    )
+    for lang, lang_param in LANG_PARAMS.items():
+        for spell in catalogue.spells:
+            if slug := spell.slug(lang):
+                pages.append(
+                    CrawledPage("spell", AIDEDD_SPELLS_URL, ((lang_param, slug),))
+                )
+        for character_class in CharacterClass:
+            class_ = character_class.translate(lang)
+            if character_class == CharacterClass.artificer:
+                url = AIDEDD_UNEARTHED_ARCANA_URL.format(class_=class_)
+            else:
+                url = AIDEDD_CLASS_RULES_URL[lang].format(class_=class_)
+            pages.append(CrawledPage("class", url))
+        for ancestry in CharacterAncestry:
+            url = AIDEDD_RACE_RULES_URL[lang].format(ancestry=ancestry.translate(lang))
+            pages.append(CrawledPage("ancestry", url))
+    return pages
+
+
+class MirrorCrawler:
+    """Crawl aidedd into a new snapshot, with at most `jobs` requests in flight.
+
+    The pace of the requests is set by the request policy (see policy.py).
+
+    """
+
+    def __init__(self, jobs: int = 2, max_pages: int | None = None):
+        self.jobs = jobs
+        self.max_pages = max_pages
+        self.version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        # The snapshot is written in a temporary directory, and only renamed
+        # after its version once the crawl is complete
+        self.directory = snapshots_directory() / f"{self.version}.partial"
+        self.pages = PageCache(
+            directory=self.directory, ttl=float("inf"), max_size=sys.maxsize
+        )
+        self.crawled: Counter[str] = Counter()
+        self.failures: dict[str, str] = {}
+
+    def fetch(self, page: CrawledPage) -> list[CrawledPage]:
+        """Mirror the page, and return the pages it links to"""
+        resp = get_session().get(page.url, params=dict(page.params))
+        resp.raise_for_status()
+        self.pages.set(
+            page.url,
+            dict(page.params),
+            resp.text,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
+        links = []
+        for link in parse_html(resp.text).find_all("a", href=True):
+            if linked_page := canonical_page(link.attrs["href"], resp.url):
+                links.append(linked_page)
+        return links
+
+    def crawl(self) -> Path:
+        """Crawl every page, and return the directory of the complete snapshot"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        catalogue = SpellCatalogue.build()
+        catalogue.save(self.directory / CATALOGUE_FILENAME)
+
+        seen: set[str] = set()
+        pending: deque[CrawledPage] = deque()
+
+        def enqueue(pages: list[CrawledPage]):
+            for page in pages:
+                if page.key not in seen and (
+                    self.max_pages is None or len(seen) < self.max_pages
+                ):
+                    seen.add(page.key)
+                    pending.append(page)
+
+        enqueue(seed_pages(catalogue))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            fetching: dict[concurrent.futures.Future, CrawledPage] = {}
+            while pending or fetching:
+                while pending and len(fetching) < self.jobs:
+                    page = pending.popleft()
+                    fetching[pool.submit(self.fetch, page)] = page
+                done, _ = concurrent.futures.wait(
+                    fetching, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    page = fetching.pop(future)
+                    try:
+                        enqueue(future.result())
+                    except Exception as exc:
+                        self.failures[str(page)] = str(exc)
+                        print(f"Failed to crawl {page}: {exc}", file=sys.stderr)
+                        continue
+                    self.crawled[page.kind] += 1
+                    print(
+                        f"Crawled {sum(self.crawled.values())}/{len(seen)} pages",
+                        file=sys.stderr,
+                    )
+        return self.complete()
+
+    def complete(self) -> Path:
+        with open(self.directory / "manifest.json", "w") as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "created_at": time.time(),
+                    "pages": dict(self.crawled),
+                    "failures": self.failures,
+                },
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+        directory = self.directory.with_name(self.version)
+        if directory.exists():
+            shutil.rmtree(directory)
+        self.directory.rename(directory)
+        (snapshots_directory() / "LATEST").write_text(self.version)
+        return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mirror the aidedd pages into a local snapshot"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help=f"Directory in which the snapshots are stored (default: {Config.CACHE_DIR})",
+        default=Config.CACHE_DIR,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of pages fetched concurrently (default: 2)",
+        default=2,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Average number of requests per second sent to aidedd (default: 2)",
+        default=2.0,
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        help="Stop following links past this number of pages (default: no limit)",
+    )
+    add_http_archive_arguments(parser)
+    args = parser.parse_args()
+    Config.CACHE_DIR = args.cache_dir
+    Config.MAX_WORKERS = args.jobs
+    Config.MAX_REQUESTS_PER_SECOND = args.rate_limit
+    configure_http_archive(args)
+
+    crawler = MirrorCrawler(jobs=args.jobs, max_pages=args.max_pages)
+    directory = crawler.crawl()
+    print(
+        f"Snapshot {crawler.version}: {sum(crawler.crawled.values())} pages, "
+        f"{len(crawler.failures)} failures, in {directory}"
+    )
+
+
+if __name__ == "__main__":
+    main()
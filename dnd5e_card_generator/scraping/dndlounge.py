@@ -1,17 +1,23 @@
+import argparse
 import json
 
-import requests
 from bs4 import BeautifulSoup
 
 from dnd5e_card_generator.const import DATA_DIR
 from dnd5e_card_generator.models import SpellType
+from dnd5e_card_generator.scraping.archive import (
+    add_http_archive_arguments,
+    configure_http_archive,
+)
+from dnd5e_card_generator.scraping.page import parse_html
+from dnd5e_card_generator.scraping.session import get_session
 
 
 class DndLoungeScraper:
     def parse_html(self, url: str) -> BeautifulSoup:
-        resp = requests.get(url)
+        resp = get_session().get(url)
         resp.raise_for_status()
-        return BeautifulSoup(resp.text, features="html.parser")
+        return parse_html(resp.text)
 
     def parse_spell_names(self, url: str) -> list[str]:
         soup = self.parse_html(url)
@@ -39,6 +45,11 @@ class DndLoungeScraper:
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Scrape the type of each spell from dndlounge.com"
+    )
+    add_http_archive_arguments(parser)
+    configure_http_archive(parser.parse_args())
     spells_by_type = DndLoungeScraper().scrape_spells_by_spells_type()
     with open(DATA_DIR / "spell_by_types.json", "w") as f:
         json.dump(spells_by_type, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,87 @@
+from typing import Mapping
+from urllib.parse import urlencode
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.metrics import PAGE_CACHE_REQUESTS
+from dnd5e_card_generator.profiling import profile_stage, profiled
+from dnd5e_card_generator.scraping.cache import CacheEntry, get_page_cache
+from dnd5e_card_generator.scraping.session import get_session
+from dnd5e_card_generator.scraping.snapshot import get_snapshot
+
+
+@profiled("cache_read")
+def cached_entry(url: str, params: dict | None = None) -> CacheEntry | None:
+    """Return the cache entry of the page, fresh or not, unless the cache is bypassed"""
+    if Config.BYPASS_CACHE:
+        return None
+    return get_page_cache().read(url, params)
+
+
+def snapshot_html(url: str, params: dict | None = None) -> str | None:
+    """Return the HTML of the page from the configured snapshot, if any.
+
+    Raise SnapshotMiss if the page is missing from the snapshot and
+    Config.SNAPSHOT_OFFLINE is set.
+
+    """
+    if (snapshot := get_snapshot()) is None:
+        return None
+    if (html := snapshot.get(url, params)) is None:
+        snapshot.miss(f"page {url}?{urlencode(params or {})}")
+    return html
+
+
+def is_fresh(entry: CacheEntry | None) -> bool:
+    return entry is not None and entry.age() <= get_page_cache().ttl
+
+
+@profiled("cache_write")
+def store_response(
+    url: str,
+    params: dict | None,
+    entry: CacheEntry | None,
+    status: int,
+    text: str,
+    headers: Mapping[str, str],
+) -> str:
+    """Cache the response to a (possibly conditional) request, and return the page HTML.
+
+    A 304 response means that the stale cache entry is still valid, in which case
+    its freshness is renewed without having transferred the page again.
+
+    """
+    if status == 304 and entry is not None:
+        PAGE_CACHE_REQUESTS.inc(result="revalidated")
+        html = entry.html
+        etag = headers.get("ETag", entry.etag)
+        last_modified = headers.get("Last-Modified", entry.last_modified)
+    else:
+        PAGE_CACHE_REQUESTS.inc(result="miss")
+        html = text
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+    get_page_cache().set(url, params, html, etag=etag, last_modified=last_modified)
+    return html
+
+
+@profiled("fetch")
+def fetch_page(url: str, params: dict | None = None) -> str:
+    """Return the HTML of the page, from the snapshot or the page cache if possible.
+
+    Expired cache entries are revalidated with If-None-Match/If-Modified-Since
+    headers, so that unchanged pages are not downloaded again.
+
+    """
+    if (html := snapshot_html(url, params)) is not None:
+        PAGE_CACHE_REQUESTS.inc(result="snapshot")
+        return html
+    entry = cached_entry(url, params)
+    if entry is not None and is_fresh(entry):
+        PAGE_CACHE_REQUESTS.inc(result="hit")
+        return entry.html
+    headers = entry.validator_headers() if entry else {}
+    with profile_stage("network"):
+        # Hedged by the session adapter, when hedging is enabled
+        resp = get_session().get(url, params=params, headers=headers)
+        resp.raise_for_status()
+    return store_response(url, params, entry, resp.status_code, resp.text, resp.headers)
@@ -0,0 +1,179 @@
+"""Build english spells from the 5e-sheets dataset bundled in data/spells.json.
+
+The dataset holds the structured properties of each spell, as well as its
+description, so no page needs to be fetched from aidedd.
+
+"""
+
+import re
+import sys
+from functools import cache
+from typing import Optional
+
+from dnd5e_card_generator.const import FIVE_E_SHEETS_SPELLS
+from dnd5e_card_generator.export.spell import Spell
+from dnd5e_card_generator.models import DamageType, Language, MagicSchool, SpellShape
+from dnd5e_card_generator.scraping.aidedd import InvalidElement, PageNotFound
+from dnd5e_card_generator.utils import slugify
+
+# Matches the innermost {@tag text} markup of a description
+TAG_PATTERN = re.compile(r"\{@(?P<tag>\w+) (?P<text>[^{}]*)\}")
+UPCASTING_PREFIX = "When you cast this spell using a spell slot"
+
+
+@cache
+def five_e_sheets_titles_by_slug() -> dict[str, str]:
+    return {slugify(title): title for title in FIVE_E_SHEETS_SPELLS}
+
+
+def render_tag(match: re.Match) -> str:
+    """Render a {@tag text|source|display text} markup as plain text"""
+    tag, parts = match.group("tag"), match.group("text").split("|")
+    if tag in ("scaledamage", "scaledice"):
+        # {@scaledamage 8d6|3-9|1d6}: the last part is the extra damage per slot level
+        return parts[-1]
+    if tag == "chance":
+        return f"{parts[0]} percent"
+    if tag == "d20":
+        return parts[0] if parts[0].startswith("-") else f"+{parts[0]}"
+    if tag == "spell":
+        return f"_{parts[0]}_"
+    if len(parts) > 2 and parts[2]:
+        return parts[2]
+    return parts[0]
+
+
+def render_description(description: str) -> str:
+    """Replace the 5e-sheets markup by plain text.
+
+    Dice, such as in {@damage 8d6} or {@dice 1d4}, are rendered as in the aidedd
+    description, so that the card formatter can highlight them.
+
+    """
+    while True:
+        description, replacements = TAG_PATTERN.subn(render_tag, description)
+        if not replacements:
+            return description
+
+
+def pluralize(amount: int, unit: str) -> str:
+    return f"{amount} {unit}" if amount == 1 else f"{amount} {unit}s"
+
+
+class FiveESheetsSpellScraper:
+    """Build an english spell from the bundled 5e-sheets dataset, without any HTTP request"""
+
+    model = Spell
+    # Offline scrapers build their model without fetching any page
+    offline = True
+
+    def __init__(self, slug: str, lang: Language):
+        if lang != "en":
+            raise InvalidElement("The 5e-sheets dataset only contains english spells")
+        self.slug = slug
+        self.lang = lang
+
+    @property
+    def spell(self) -> dict:
+        try:
+            return FIVE_E_SHEETS_SPELLS[five_e_sheets_titles_by_slug()[self.slug]]
+        except KeyError:
+            raise PageNotFound(f"{self.slug} not found in the 5e-sheets dataset")
+
+    def scrape_casting_time(self) -> tuple[str, str]:
+        """Return the casting time, along with the reaction condition, if any"""
+        casting_times, reaction_condition = [], ""
+        for time in self.spell["time"]:
+            unit = "bonus action" if time["unit"] == "bonus" else time["unit"]
+            casting_times.append(pluralize(time["number"], unit))
+            if time["unit"] == "reaction" and time.get("condition"):
+                reaction_condition = f", {render_description(time['condition'])}"
+        return " or ".join(casting_times).capitalize(), reaction_condition
+
+    def scrape_casting_range(self) -> str:
+        casting_range = self.spell["range"]
+        distance = casting_range.get("distance", {})
+        distance_type = distance.get("type")
+        if casting_range["type"] == "special":
+            return "Special"
+        if casting_range["type"] != "point":
+            # Spells with an area of effect centered on the caster
+            unit = distance_type.rstrip("s").replace("feet", "foot")
+            return f"Self ({distance['amount']}-{unit} {casting_range['type']})"
+        if distance_type == "feet":
+            return f"{distance['amount']} feet"
+        if distance_type == "miles":
+            return pluralize(distance["amount"], "mile")
+        return distance_type.capitalize()
+
+    def scrape_effect_duration(self) -> str:
+        concentration = self.spell["casting"].get("concentration", False)
+        durations = []
+        for duration in self.spell["duration"]:
+            match duration["type"]:
+                case "instant":
+                    durations.append("Instantaneous")
+                case "timed":
+                    text = pluralize(duration["amount"], duration["unit"])
+                    if concentration or duration.get("upTo"):
+                        text = f"Up to {text}"
+                    durations.append(text)
+                case "permanent":
+                    ends = {"dispel": "dispelled", "trigger": "triggered"}
+                    durations.append(
+                        "Until "
+                        + " or ".join(ends[end] for end in duration.get("ends", []))
+                    )
+                case _:
+                    durations.append(duration["type"])
+        return " or ".join(durations).capitalize()
+
+    def scrape_paying_components(self) -> str:
+        material = self.spell["casting"].get("material")
+        if not material or "worth at least" not in material["text"]:
+            return ""
+        paying_components = material["text"].capitalize()
+        if not paying_components.endswith("."):
+            paying_components = f"{paying_components}."
+        return paying_components
+
+    def scrape_spell_texts(self) -> tuple[list[str], str]:
+        description = render_description(self.spell["meta"]["description"])
+        text = [part for part in description.split("\n") if part.strip()]
+        if text and text[-1].startswith(UPCASTING_PREFIX):
+            return text[:-1], text[-1]
+        return text, ""
+
+    def scrape_damage_type(self) -> Optional[DamageType]:
+        if damage_types := self.spell.get("damage_inflict"):
+            return DamageType.from_5esheet_tag(damage_types[0])
+        return None
+
+    def scrape(self) -> Spell:
+        print(f"Building spell {self.slug} from the 5e-sheets dataset", file=sys.stderr)
+        spell = self.spell
+        casting = spell["casting"]
+        spell_text, upcasting_text = self.scrape_spell_texts()
+        casting_time, reaction_condition = self.scrape_casting_time()
+        return Spell(
+            lang=self.lang,
+            level=spell["level"],
+            title=spell["name"],
+            en_title=spell["name"],
+            school=MagicSchool(spell["school"]),
+            casting_time=casting_time,
+            casting_range=self.scrape_casting_range(),
+            somatic=casting.get("somatic", False),
+            verbal=casting.get("verbal", False),
+            material="material" in casting,
+            paying_components=self.scrape_paying_components(),
+            effect_duration=self.scrape_effect_duration(),
+            tags=[],
+            text=spell_text,
+            upcasting_text=upcasting_text,
+            ritual=casting.get("ritual", False),
+            concentration=casting.get("concentration", False),
+            damage_type=self.scrape_damage_type(),
+            shape=SpellShape.from_5esheet_area_tags(spell.get("area_tags", [])),
+            reaction_condition=reaction_condition,
+        )
@@ -0,0 +1,170 @@
+"""Hedged requests, to cut the tail latency of the page downloads.
+
+When a request has been running for longer than a percentile of the latency
+of the recent requests, the same request is sent again, and the first response
+wins. The hedges are limited by a budget, a fraction of the requests sent, so
+that hedging only marginally increases the load on the site.
+
+Requests are hedged once they hold their host slot (see policy.py), and the
+hedge waits for a slot of its own: both the latencies and the hedge delay only
+cover the network exchange, from the request to the end of the body, not the
+wait for a slot or a token.
+
+Hedging is disabled unless Config.HEDGE_PERCENTILE is set.
+
+"""
+
+import asyncio
+import concurrent.futures
+import math
+import threading
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from dnd5e_card_generator.config import Config
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Latency of the last `window` successful requests"""
+
+    def __init__(self, window: int = 100, min_samples: int = 10):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        """Return the percentile of the recent latencies, None if too few were observed"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        rank = math.ceil(percentile / 100 * len(latencies)) - 1
+        return latencies[min(max(rank, 0), len(latencies) - 1)]
+
+
+class Hedger:
+    def __init__(self, percentile: float, budget: float):
+        self.percentile = percentile
+        self.budget = budget
+        self.tracker = LatencyTracker()
+        self.requests = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+        self.executor: concurrent.futures.ThreadPoolExecutor | None = None
+
+    def hedge_delay(self) -> float | None:
+        return self.tracker.percentile(self.percentile)
+
+    def take_hedge(self) -> bool:
+        """Return whether the budget allows sending one more hedge"""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def observe(self, latency: float):
+        """Record the latency of a network exchange, from the request to the body"""
+        self.tracker.record(latency)
+
+    def run(
+        self,
+        request: Callable[[], T],
+        hedge: Callable[[], T],
+        discard: Callable[[T], None],
+    ) -> T:
+        """Run the request, and `hedge` if the request is slower than usual.
+
+        A running request can't be interrupted, so the response of the losing
+        request is passed to `discard` once it completes.
+
+        """
+        with self.lock:
+            self.requests += 1
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=2 * Config.MAX_WORKERS,
+                    thread_name_prefix="hedging",
+                )
+        futures = [self.executor.submit(request)]
+        delay = self.hedge_delay()
+        if delay is not None:
+            done, _ = concurrent.futures.wait(futures, timeout=delay)
+            if not done and self.take_hedge():
+                futures.append(self.executor.submit(hedge))
+        pending = set(futures)
+        while True:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None or not pending:
+                break
+        if winner is None:
+            # Every request failed: raise the error of the first one
+            return futures[0].result()
+        for future in futures:
+            if future is not winner and not future.cancel():
+                future.add_done_callback(
+                    lambda f: discard(f.result()) if f.exception() is None else None
+                )
+        return winner.result()
+
+    async def arun(
+        self,
+        request: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]],
+    ) -> T:
+        """Run the request, and `hedge` if the request is slower than usual.
+
+        The loser is cancelled.
+
+        """
+        with self.lock:
+            self.requests += 1
+        tasks = [asyncio.ensure_future(request())]
+        delay = self.hedge_delay()
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.take_hedge():
+                    tasks.append(asyncio.ensure_future(hedge()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Every request failed: raise the error of the first one
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def __str__(self) -> str:
+        return f"{self.hedges} hedged requests out of {self.requests}"
+
+
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger | None:
+    """Return the process-wide hedger, or None if hedging is disabled"""
+    global _hedger
+    if Config.HEDGE_PERCENTILE is None:
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(
+                percentile=Config.HEDGE_PERCENTILE, budget=Config.HEDGE_BUDGET
+            )
+        return _hedger
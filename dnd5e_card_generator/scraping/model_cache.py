@@ -0,0 +1,206 @@
+"""Second cache tier, storing the models scraped from the cached pages.
+
+Warm runs read the page HTML from the page cache, but would still parse it and
+run every scraping rule again to rebuild the same models. The fields of each
+scraped model are instead stored in a SQLite database, keyed by page URL, item,
+scraper and lang, along with the hash of the page they were scraped from and
+the version of the scraper code. A stored model is only used if both are still
+the same, so that a page change or a scraper change invalidates it.
+
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import typing
+from dataclasses import fields
+from enum import Enum
+from functools import cache
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.profiling import profile_stage, profiled
+
+# Modules used by every scraper, in addition to the ones defining the scraper
+# and its model
+SHARED_SCRAPING_MODULES = [
+    "dnd5e_card_generator.models",
+    "dnd5e_card_generator.scraping.page",
+    "dnd5e_card_generator.scraping.text",
+]
+
+
+@cache
+def scraper_version(ScraperCls: type) -> str:
+    """Return the digest of the source code the scraper and its model depend on"""
+    classes = list(ScraperCls.__mro__)
+    if ScraperCls.model is not None:  # pyright: ignore
+        classes.extend(ScraperCls.model.__mro__)  # pyright: ignore
+    module_names = {cls.__module__ for cls in classes} | set(SHARED_SCRAPING_MODULES)
+    digest = hashlib.sha256()
+    for module_name in sorted(module_names):
+        if module_name.startswith("dnd5e_card_generator"):
+            digest.update(Path(sys.modules[module_name].__file__).read_bytes())  # type: ignore
+    return digest.hexdigest()
+
+
+def page_hash(html: str) -> str:
+    return hashlib.sha256(html.encode()).hexdigest()
+
+
+def encode_model(model: Any) -> str:
+    return json.dumps(
+        {field.name: getattr(model, field.name) for field in fields(model)},
+        ensure_ascii=False,
+    )
+
+
+def decode_field(type_hint: Any, value: Any) -> Any:
+    """Convert a JSON-decoded value back to the enum it was stored from, if any"""
+    if value is None:
+        return None
+    for candidate in typing.get_args(type_hint) or (type_hint,):
+        if isinstance(candidate, type) and issubclass(candidate, Enum):
+            return candidate(value)
+    return value
+
+
+def decode_model(ModelCls: type, data: str) -> Any:
+    type_hints = typing.get_type_hints(ModelCls)
+    return ModelCls(
+        **{
+            name: decode_field(type_hints[name], value)
+            for name, value in json.loads(data).items()
+        }
+    )
+
+
+class ModelCache:
+    """SQLite store of the scraped models.
+
+    Each thread (and each parse worker process) uses its own connection, and
+    concurrent writers wait for each other thanks to the write-ahead log.
+
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS models (
+            url TEXT NOT NULL,
+            item TEXT NOT NULL,
+            scraper TEXT NOT NULL,
+            lang TEXT NOT NULL,
+            version TEXT NOT NULL,
+            page_hash TEXT NOT NULL,
+            fields TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            PRIMARY KEY (url, item, scraper, lang)
+        )
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Connections can't be shared with forked processes
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.schema)
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    @staticmethod
+    def key(scraper) -> tuple[str, str, str, str]:
+        url = f"{scraper.base_url}?{urlencode(sorted(scraper.query_params.items()))}"
+        return url, scraper.item_key, type(scraper).__name__, scraper.lang
+
+    @profiled("model_cache_read")
+    def get(self, scraper, html_hash: str) -> Any | None:
+        """Return the model stored for the scraper, unless the page or scraper changed"""
+        try:
+            row = self.connection.execute(
+                "SELECT version, page_hash, fields FROM models "
+                "WHERE url = ? AND item = ? AND scraper = ? AND lang = ?",
+                self.key(scraper),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        version, stored_page_hash, data = row
+        if version != scraper_version(type(scraper)) or stored_page_hash != html_hash:
+            return None
+        return decode_model(scraper.model, data)
+
+    @profiled("model_cache_write")
+    def set(self, scraper, html_hash: str, model: Any):
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        *self.key(scraper),
+                        scraper_version(type(scraper)),
+                        html_hash,
+                        encode_model(model),
+                        time.time(),
+                    ),
+                )
+        except sqlite3.Error:
+            # The model cache is an optimization: failing to store a model
+            # must not fail the run.
+            pass
+
+
+_model_cache: ModelCache | None = None
+_model_cache_lock = threading.Lock()
+
+
+def get_model_cache() -> ModelCache:
+    """Return the process-wide model cache, configured after Config"""
+    global _model_cache
+    with _model_cache_lock:
+        if _model_cache is None:
+            _model_cache = ModelCache(Path(Config.CACHE_DIR) / "models.sqlite3")
+        return _model_cache
+
+
+def cached_scrape(scraper) -> Any:
+    """Return the model of the scraper, from the model cache if its page did not change.
+
+    Offline scrapers don't parse any page, and are always run. The page of the
+    other scrapers is released once their model is built.
+
+    """
+    if scraper.offline:
+        with profile_stage("scrape"):
+            return scraper.scrape()
+    try:
+        return _cached_scrape(scraper)
+    finally:
+        scraper.release()
+
+
+def _cached_scrape(scraper) -> Any:
+    if scraper.model is None or Config.BYPASS_CACHE:
+        with profile_stage("scrape"):
+            return scraper.scrape()
+    # The page is fetched (or read from the page cache) anyway, to detect changes
+    scraper.html = scraper.fetch_data()
+    html_hash = page_hash(scraper.html)
+    model_cache = get_model_cache()
+    if (model := model_cache.get(scraper, html_hash)) is not None:
+        return model
+    with profile_stage("scrape"):
+        model = scraper.scrape()
+    model_cache.set(scraper, html_hash, model)
+    return model
@@ -0,0 +1,129 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from bs4.filter import ElementFilter
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.profiling import profiled
+
+SECTION_HEADINGS = ["h2", "h3", "h4"]
+
+
+def lxml_available() -> bool:
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def html_parser() -> str:
+    """Return the name of the BeautifulSoup parser backend to use.
+
+    lxml is much faster than the builtin html.parser, and is used when installed,
+    unless a parser was explicitly configured.
+
+    """
+    if Config.HTML_PARSER != "auto":
+        return Config.HTML_PARSER
+    return "lxml" if lxml_available() else "html.parser"
+
+
+class ContentFilter(ElementFilter):
+    """Only build the parts of an aidedd page read by the scrapers.
+
+    These are the div containing the page content, along with the h1 and img
+    tags, wherever they are. Everything else (navigation menus, sidebars,
+    footer, scripts, etc) is discarded while parsing.
+
+    """
+
+    content_div_classes = {"col1", "content"}
+    tag_names = {"h1", "img"}
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        if name in self.tag_names:
+            return True
+        if name != "div":
+            return False
+        classes = (attrs or {}).get("class") or []
+        if isinstance(classes, str):
+            classes = classes.split()
+        return bool(self.content_div_classes.intersection(classes))
+
+    def allow_string_creation(self, string: str) -> bool:
+        return False
+
+
+@profiled("parse")
+def parse_html(html: str, partial: bool = False) -> BeautifulSoup:
+    """Parse the HTML with the configured backend.
+
+    If partial=True, only the parts of the page read by the scrapers are parsed.
+
+    """
+    return BeautifulSoup(
+        html,
+        features=html_parser(),
+        parse_only=ContentFilter() if partial else None,
+    )
+
+
+@dataclass
+class Section:
+    """Content of a page located between an h3/h4 heading and the next heading"""
+
+    heading: Tag
+    # Last h2 and h3 headings seen before the section heading
+    h2: Tag | None
+    h3: Tag | None
+    # Every tag of the section, in document order
+    elements: list[Tag] = field(default_factory=list)
+
+    @property
+    def title(self) -> str:
+        return self.heading.text
+
+
+class ParsedPage:
+    """A parsed aidedd page, along with an index of its sections.
+
+    The page can be shared by several scrapers, which must thus treat it as
+    read-only.
+
+    """
+
+    def __init__(self, soup: BeautifulSoup, div_content: Tag):
+        self.soup = soup
+        self.div_content = div_content
+
+    @cached_property
+    def sections(self) -> list[Section]:
+        """Index all the h3/h4 sections of the page in a single pass over the document"""
+        sections: list[Section] = []
+        current: Section | None = None
+        last_seen_h2: Tag | None = None
+        last_seen_h3: Tag | None = None
+        for tag in self.soup.find_all():
+            if tag.name not in SECTION_HEADINGS:
+                if current is not None:
+                    current.elements.append(tag)
+                continue
+            current = None
+            if tag.name in ("h3", "h4"):
+                current = Section(heading=tag, h2=last_seen_h2, h3=last_seen_h3)
+                sections.append(current)
+            if tag.name == "h2":
+                last_seen_h2 = tag
+            elif tag.name == "h3":
+                last_seen_h3 = tag
+        return sections
+
+    @cached_property
+    def sections_by_title(self) -> dict[str, Section]:
+        index: dict[str, Section] = {}
+        for section in self.sections:
+            index.setdefault(section.title, section)
+        return index
@@ -0,0 +1,260 @@
+"""Request policy shared by every HTTP request of the process, per host.
+
+- requests are rate limited by a token bucket per host
+- the number of requests in flight per host is adjusted with an AIMD scheme:
+  it grows by one every `limit` successful requests, and is halved when the
+  recent error rate of the host exceeds a threshold
+- requests failing with 429/5xx or a connection error are retried a bounded
+  number of times, with an exponential and jittered backoff, as long as the
+  request deadline is not exceeded
+
+The policy doesn't depend on the HTTP client, and is used both by the
+requests session and by the asyncio engine.
+
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Iterator, Mapping
+from urllib.parse import urlparse
+
+from dnd5e_card_generator.config import Config
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, and bursts of `burst` requests"""
+
+    def __init__(self, rate: float | None, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, and return the number of seconds to wait before using it"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            # A negative balance is a token borrowed from the future
+            return max(-self.tokens / self.rate, 0.0)
+
+
+class AIMDLimiter:
+    """Limit of concurrent requests, adjusted after the observed error rate"""
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        window: int = 20,
+        error_threshold: float = 0.1,
+        cooldown: float = 1.0,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        # Outcome of the last `window` requests, True for errors
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.error_threshold = error_threshold
+        # Minimum delay between two decreases, so that the errors of the
+        # requests that were in flight at the same time only count once
+        self.cooldown = cooldown
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+        # Futures of the coroutines waiting for a slot, along with their event
+        # loop, as the limiter is shared between threads and event loops
+        self.async_waiters: list[
+            tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]
+        ] = []
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def acquire(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, error: bool):
+        with self.condition:
+            self.in_flight -= 1
+            self.outcomes.append(error)
+            now = time.monotonic()
+            if not error:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif (
+                self.error_rate > self.error_threshold
+                and now - self.decreased_at >= self.cooldown
+            ):
+                self.limit = max(self.minimum, self.limit / 2)
+                self.decreased_at = now
+            self.condition.notify_all()
+            for loop, waiter in self.async_waiters:
+                loop.call_soon_threadsafe(wake_up, waiter)
+            self.async_waiters.clear()
+
+
+def wake_up(waiter: asyncio.Future[None]):
+    # The waiter is cancelled if its coroutine was cancelled while waiting
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RequestOutcome:
+    """Outcome of a request, reported to the AIMD limiter once it completes"""
+
+    def __init__(self):
+        # Requests interrupted by an exception count as errors
+        self.error = True
+
+    def record(self, status: int | None):
+        """Record the status of the response, None meaning a connection error"""
+        self.error = status is None or status in RETRY_STATUSES
+
+
+class HostPolicy:
+    def __init__(self, host: str, rate: float | None, burst: int, concurrency: int):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AIMDLimiter(maximum=concurrency)
+
+    @contextmanager
+    def slot(self) -> Iterator[RequestOutcome]:
+        """Wait for a concurrency slot and a token, for the duration of a request"""
+        self.limiter.acquire()
+        outcome = RequestOutcome()
+        try:
+            time.sleep(self.bucket.reserve())
+            yield outcome
+        finally:
+            self.limiter.release(outcome.error)
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[RequestOutcome]:
+        """Wait for a concurrency slot and a token, without blocking the event loop"""
+        await self.limiter.aacquire()
+        outcome = RequestOutcome()
+        try:
+            await asyncio.sleep(self.bucket.reserve())
+            yield outcome
+        finally:
+            self.limiter.release(outcome.error)
+
+
+def retry_after(headers: Mapping[str, str]) -> float:
+    """Return the number of seconds the server asked to wait before retrying"""
+    value = headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class RequestPolicy:
+    def __init__(
+        self,
+        rate: float | None,
+        burst: int,
+        concurrency: int,
+        retries: int,
+        backoff: float,
+        backoff_max: float,
+        deadline: float,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hosts: dict[str, HostPolicy] = {}
+        self.lock = threading.Lock()
+
+    def host(self, url: str) -> HostPolicy:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostPolicy(
+                    host, self.rate, self.burst, self.concurrency
+                )
+            return self.hosts[host]
+
+    def request_deadline(self) -> float:
+        return time.monotonic() + self.deadline
+
+    def retry_delay(
+        self,
+        attempt: int,
+        status: int | None,
+        headers: Mapping[str, str],
+        deadline: float,
+    ) -> float | None:
+        """Return the delay before retrying a request, or None if it shouldn't be retried.
+
+        status is None when the request failed with a connection error.
+
+        """
+        if status is not None and status not in RETRY_STATUSES:
+            return None
+        if attempt >= self.retries:
+            return None
+        # Full jitter: a random delay up to the exponential backoff
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+        delay = max(delay, retry_after(headers))
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+
+_policy: RequestPolicy | None = None
+_policy_lock = threading.Lock()
+
+
+def get_request_policy() -> RequestPolicy:
+    """Return the process-wide request policy, configured after Config"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = RequestPolicy(
+                rate=Config.MAX_REQUESTS_PER_SECOND,
+                burst=Config.REQUESTS_BURST,
+                concurrency=Config.MAX_WORKERS_PER_HOST or Config.MAX_WORKERS,
+                retries=Config.HTTP_RETRIES,
+                backoff=Config.HTTP_BACKOFF,
+                backoff_max=Config.HTTP_BACKOFF_MAX,
+                deadline=Config.HTTP_DEADLINE,
+            )
+        return _policy
@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class PageRegistry(Generic[T]):
+    """Per-run registry of parsed pages, keyed by page URL.
+
+    The first scraper requesting a page loads it, and every other scraper
+    requesting the same page, concurrently or later on, gets the same
+    parsed document instead of fetching and parsing it again, until the page
+    is discarded.
+
+    """
+
+    def __init__(self):
+        self.pages: dict[str, Future[T]] = {}
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key: str, loader: Callable[[], T]) -> T:
+        with self.lock:
+            future = self.pages.get(key)
+            owner = future is None
+            if future is None:
+                future = self.pages[key] = Future()
+        if owner:
+            try:
+                future.set_result(loader())
+            except BaseException as exc:
+                future.set_exception(exc)
+        return future.result()
+
+    def discard(self, key: str):
+        """Forget the page, so that its parsed document can be garbage collected"""
+        with self.lock:
+            self.pages.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.pages
+
+    def __len__(self) -> int:
+        return len(self.pages)
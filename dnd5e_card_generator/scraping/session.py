@@ -0,0 +1,255 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.metrics import record_http_response, record_http_retry
+from dnd5e_card_generator.scraping.archive import (
+    REPLAY,
+    ArchivedResponse,
+    get_http_archive,
+)
+from dnd5e_card_generator.scraping.hedging import get_hedger
+from dnd5e_card_generator.scraping.policy import (
+    RETRY_STATUSES,
+    HostPolicy,
+    get_request_policy,
+)
+
+# Errors of a request that are retried, like the 429/5xx responses
+NETWORK_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+@dataclass
+class ConnectionStats:
+    """Counters used to check that the HTTP connections are kept alive and reused"""
+
+    requests: int = 0
+    connections: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def reset(self):
+        with self.lock:
+            self.requests, self.connections = 0, 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests, {self.connections} new connections, "
+            f"{self.reused} reused"
+        )
+
+
+CONNECTION_STATS = ConnectionStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        CONNECTION_STATS.record_connection()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        CONNECTION_STATS.record_connection()
+        return super()._new_conn()
+
+
+def request_body(request: requests.PreparedRequest) -> str | None:
+    if isinstance(request.body, bytes):
+        return request.body.decode()
+    return request.body  # pyright: ignore
+
+
+def replayed_response(
+    request: requests.PreparedRequest, archived: ArchivedResponse
+) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = archived.status
+    resp.reason = archived.reason
+    resp.headers = CaseInsensitiveDict(archived.headers)
+    resp._content = archived.text.encode()
+    resp.encoding = "utf-8"
+    resp.url = request.url  # pyright: ignore
+    resp.request = request
+    resp.elapsed = timedelta(seconds=archived.elapsed)
+    return resp
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter counting requests and connections, and enforcing a default timeout.
+
+    When an HTTP archive is configured, the responses are either recorded into
+    it or replayed from it (see archive.py).
+
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):  # pyright: ignore
+        """Send the request through the request policy of its host.
+
+        Requests failing with 429/5xx or a connection error are retried, and
+        the last response or error is returned once out of retries.
+
+        """
+        archive = get_http_archive()
+        if archive is not None and archive.mode == REPLAY:
+            archived = archive.lookup(
+                request.method, request.url, None, request_body(request)
+            )
+            delay = archive.replay_delay(archived)
+            time.sleep(delay)
+            resp = replayed_response(request, archived)
+            record_http_response(
+                request.url, resp.status_code, delay, len(resp.content)
+            )
+            return resp
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = Config.HTTP_TIMEOUT
+        policy = get_request_policy()
+        host = policy.host(request.url)
+        hedger = get_hedger() if request.method == "GET" else None
+        deadline = policy.request_deadline()
+        attempt = 0
+        while True:
+            resp, error = None, None
+            with host.slot() as outcome:
+                try:
+                    if hedger is not None:
+                        resp, elapsed = hedger.run(
+                            lambda: self.exchange(request, **kwargs),
+                            hedge=lambda: self.slotted_exchange(
+                                host, request, **kwargs
+                            ),
+                            discard=lambda result: result[0].close(),
+                        )
+                    else:
+                        resp, elapsed = self.exchange(request, **kwargs)
+                except NETWORK_ERRORS as exc:
+                    error = exc
+                outcome.record(resp.status_code if resp is not None else None)
+            delay = policy.retry_delay(
+                attempt,
+                resp.status_code if resp is not None else None,
+                resp.headers if resp is not None else {},
+                deadline,
+            )
+            if delay is None:
+                if error is not None:
+                    raise error
+                if archive is not None:
+                    archive.record(
+                        request.method,
+                        request.url,
+                        None,
+                        request_body(request),
+                        ArchivedResponse(
+                            status=resp.status_code,
+                            reason=resp.reason,
+                            headers=dict(resp.headers),
+                            text=resp.text,
+                            elapsed=elapsed,
+                        ),
+                    )
+                return resp
+            record_http_retry(request.url)
+            if resp is not None:
+                resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def exchange(self, request, **kwargs) -> tuple[requests.Response, float]:
+        """Send the request once, and return the response along with its latency.
+
+        The adapter returns once the headers are read: the body is downloaded
+        here, so that it is timed along with them, within the host slot of the
+        caller.
+
+        """
+        CONNECTION_STATS.record_request()
+        start = time.monotonic()
+        try:
+            resp = super().send(request, **kwargs)
+            body_size = 0 if kwargs.get("stream") else len(resp.content)
+        except NETWORK_ERRORS:
+            record_http_response(request.url, None, time.monotonic() - start)
+            raise
+        elapsed = time.monotonic() - start
+        record_http_response(request.url, resp.status_code, elapsed, body_size)
+        hedger = get_hedger()
+        if hedger is not None and resp.status_code not in RETRY_STATUSES:
+            hedger.observe(elapsed)
+        return resp, elapsed
+
+    def slotted_exchange(
+        self, host: HostPolicy, request, **kwargs
+    ) -> tuple[requests.Response, float]:
+        """Send the request once, within a slot of its own (as a hedge)"""
+        with host.slot() as outcome:
+            resp, elapsed = self.exchange(request, **kwargs)
+            outcome.record(resp.status_code)
+            return resp, elapsed
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide HTTP session, creating it on first use.
+
+    The connection pool is sized after Config.MAX_WORKERS, so that each worker
+    can keep its own connection alive to aidedd.org.
+
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = PooledHTTPAdapter(
+                pool_connections=Config.MAX_WORKERS,
+                pool_maxsize=Config.MAX_WORKERS,
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def close_session():
+    """Close the process-wide session. A new one will be created on the next request."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def connection_stats() -> ConnectionStats:
+    return CONNECTION_STATS
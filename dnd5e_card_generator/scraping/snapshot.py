@@ -0,0 +1,104 @@
+"""Versioned local mirrors of the aidedd pages, written by the crawler.
+
+Each snapshot is stored in its own directory of the cache directory, named
+after the date of the crawl:
+
+    <cache dir>/snapshots/20250101T120000Z/
+        manifest.json           # crawl metadata
+        spell_catalogue.json    # catalogue used to resolve the spell filters
+        ab/ab12...html.gz       # pages, in the page cache format
+
+The LATEST file of the snapshots directory holds the version of the most
+recent complete snapshot. When Config.SNAPSHOT is set, the pages of the
+snapshot are used instead of the page cache, without any HTTP request. The
+pages missing from the snapshot are fetched from aidedd with a warning, or
+fail with SnapshotMiss when Config.SNAPSHOT_OFFLINE is set.
+
+"""
+
+import json
+import sys
+import threading
+from functools import cached_property
+from pathlib import Path
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.profiling import profiled
+from dnd5e_card_generator.scraping.cache import PageCache
+
+LATEST = "latest"
+
+
+class SnapshotNotFound(Exception): ...
+
+
+class SnapshotMiss(Exception): ...
+
+
+def snapshots_directory() -> Path:
+    return Path(Config.CACHE_DIR) / "snapshots"
+
+
+def snapshot_directory(version: str) -> Path:
+    """Return the directory of the snapshot, "latest" meaning the most recent one"""
+    if version == LATEST:
+        try:
+            version = (snapshots_directory() / "LATEST").read_text().strip()
+        except FileNotFoundError:
+            raise SnapshotNotFound(f"No snapshot found in {snapshots_directory()}")
+    directory = snapshots_directory() / version
+    if not (directory / "manifest.json").exists():
+        raise SnapshotNotFound(f"Snapshot {version} not found in {directory}")
+    return directory
+
+
+class Snapshot:
+    """Read-only mirror of the aidedd pages"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.pages = PageCache(
+            directory=directory,
+            ttl=float("inf"),
+            max_size=sys.maxsize,
+            track_access=False,
+        )
+
+    @property
+    def version(self) -> str:
+        return self.directory.name
+
+    @cached_property
+    def manifest(self) -> dict:
+        with open(self.directory / "manifest.json") as f:
+            return json.load(f)
+
+    @profiled("snapshot_read")
+    def get(self, url: str, params: dict | None = None) -> str | None:
+        """Return the HTML of the page, or None if it wasn't mirrored"""
+        entry = self.pages.read(url, params)
+        return entry.html if entry else None
+
+    def miss(self, what: str):
+        """Report a resource missing from the snapshot, before it is fetched from aidedd"""
+        if Config.SNAPSHOT_OFFLINE:
+            raise SnapshotMiss(f"{what} not found in snapshot {self.version}")
+        print(
+            f"WARNING: {what} not found in snapshot {self.version}, fetching it",
+            file=sys.stderr,
+        )
+
+
+_snapshot: Snapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Snapshot | None:
+    """Return the process-wide snapshot configured after Config, if any"""
+    global _snapshot
+    if Config.SNAPSHOT is None:
+        return None
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = Snapshot(snapshot_directory(Config.SNAPSHOT))
+        return _snapshot
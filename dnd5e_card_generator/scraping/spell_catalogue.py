@@ -0,0 +1,208 @@
+"""Local catalogue of the aidedd spells, used to resolve the spell filters in memory.
+
+The catalogue is built once from the aidedd spell tables, and stored in the
+cache directory until it expires. Resolving a filter then doesn't issue any
+request.
+
+The spell tables don't list the classes nor the level of the spells, so a table
+is requested per level and per class, to index both. The school, ritual,
+concentration and source book of each spell are taken from the bundled
+5e-sheets dataset.
+
+"""
+
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import cast
+from urllib.parse import parse_qs, urlparse
+
+from bs4.element import Tag
+
+from dnd5e_card_generator.config import Config
+from dnd5e_card_generator.const import AIDEDD_SPELLS_FILTER_URL, FIVE_E_SHEETS_SPELLS
+from dnd5e_card_generator.models import CliSpell, Language
+from dnd5e_card_generator.scraping.aidedd import ElementNotFound, SpellFilter
+from dnd5e_card_generator.scraping.page import parse_html
+from dnd5e_card_generator.scraping.session import get_session
+from dnd5e_card_generator.scraping.snapshot import get_snapshot
+from dnd5e_card_generator.utils import slugify
+
+CLASS_CODES = sorted(set(SpellFilter.class_name_synonyms.values()))
+SPELL_LEVELS = range(10)
+SOURCES = ["base", "xgte", "tcoe", "ftod"]
+CATALOGUE_FILENAME = "spell_catalogue.json"
+
+
+@dataclass
+class CatalogueSpell:
+    fr_slug: str
+    en_slug: str
+    en_title: str
+    level: int
+    classes: list[str]
+    school: str | None = None
+    ritual: bool = False
+    concentration: bool = False
+    source: str | None = None
+
+    def slug(self, lang: str) -> str:
+        return self.fr_slug if lang == "fr" else self.en_slug
+
+    def matches(self, spell_filter: SpellFilter) -> bool:
+        return (
+            spell_filter.class_code in self.classes
+            and spell_filter.min_level <= self.level <= spell_filter.max_level
+        )
+
+
+def fetch_spell_table(
+    class_codes: list[str], min_level: int, max_level: int
+) -> list[tuple[str, str]]:
+    """Return the (french slug, english title) of the spells of the aidedd spell table"""
+    resp = get_session().post(
+        AIDEDD_SPELLS_FILTER_URL,
+        headers={
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+        data={
+            "Filtre1[]": class_codes,
+            "nivMin": min_level,
+            "nivMax": max_level,
+            "source[]": SOURCES,
+            "opt_tcoe": "S",
+            "colE": "on",
+            "colI": "on",
+            "colC": "on",
+            "colR": "on",
+            "colVO": "on",
+            "filtrer": "FILTRER",
+        },
+    )
+    resp.raise_for_status()
+    table = parse_html(resp.text).find("table")
+    if not table:
+        raise ElementNotFound("no table found in page")
+    spells = []
+    for spell_row in cast(Tag, table).find_all("tr")[1:]:  # skip headers
+        link = spell_row.find("a")
+        en_title = spell_row.find("td", class_="colVO")
+        if not link or not en_title:
+            continue
+        query = parse_qs(urlparse(link.attrs["href"]).query)
+        spells.append((query["vf"][0], en_title.text.strip()))
+    return spells
+
+
+class SpellCatalogue:
+    def __init__(self, spells: list[CatalogueSpell], built_at: float):
+        self.spells = spells
+        self.built_at = built_at
+
+    @classmethod
+    def build(cls) -> "SpellCatalogue":
+        print("Building the spell catalogue from aidedd.org", file=sys.stderr)
+        with concurrent.futures.ThreadPoolExecutor(Config.MAX_WORKERS) as executor:
+            tables_by_level = executor.map(
+                lambda level: fetch_spell_table(CLASS_CODES, level, level),
+                SPELL_LEVELS,
+            )
+            tables_by_class = executor.map(
+                lambda code: fetch_spell_table(
+                    [code], min(SPELL_LEVELS), max(SPELL_LEVELS)
+                ),
+                CLASS_CODES,
+            )
+            spells: dict[str, CatalogueSpell] = {}
+            for level, table in zip(SPELL_LEVELS, tables_by_level):
+                for fr_slug, en_title in table:
+                    spells[fr_slug] = CatalogueSpell(
+                        fr_slug=fr_slug,
+                        en_slug=slugify(en_title),
+                        en_title=en_title,
+                        level=level,
+                        classes=[],
+                    )
+            for code, table in zip(CLASS_CODES, tables_by_class):
+                for fr_slug, _ in table:
+                    if fr_slug in spells:
+                        spells[fr_slug].classes.append(code)
+
+        for spell in spells.values():
+            if spell.en_title not in FIVE_E_SHEETS_SPELLS:
+                continue
+            details = FIVE_E_SHEETS_SPELLS[spell.en_title]
+            spell.school = details["school"]
+            spell.ritual = details["casting"].get("ritual", False)
+            spell.concentration = details["casting"].get("concentration", False)
+            spell.source = details.get("source", {}).get("book")
+        return cls(list(spells.values()), built_at=time.time())
+
+    @classmethod
+    def load(cls, path: Path) -> "SpellCatalogue":
+        with open(path) as f:
+            catalogue = json.load(f)
+        return cls(
+            [CatalogueSpell(**spell) for spell in catalogue["spells"]],
+            built_at=catalogue["built_at"],
+        )
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "built_at": self.built_at,
+                    "spells": [asdict(spell) for spell in self.spells],
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    def resolve(self, spell_filters: list[SpellFilter]) -> list[CliSpell]:
+        """Return the spells matching any of the filters, each spell only once"""
+        spells: dict[tuple[str, str], CliSpell] = {}
+        for spell_filter in spell_filters:
+            for spell in self.spells:
+                if spell.matches(spell_filter):
+                    key = (spell_filter.lang, spell.slug(spell_filter.lang))
+                    spells.setdefault(key, CliSpell(lang=Language(key[0]), slug=key[1]))
+        return list(spells.values())
+
+
+def get_spell_catalogue() -> SpellCatalogue:
+    """Return the spell catalogue stored in the cache directory, built if needed.
+
+    The catalogue is built again once older than the page cache TTL, or when
+    the cache is bypassed. When a snapshot is configured, its catalogue is used
+    whatever its age.
+
+    """
+    if (snapshot := get_snapshot()) is not None:
+        if (snapshot.directory / CATALOGUE_FILENAME).exists():
+            return SpellCatalogue.load(snapshot.directory / CATALOGUE_FILENAME)
+        snapshot.miss("spell catalogue")
+    path = Path(Config.CACHE_DIR) / CATALOGUE_FILENAME
+    if not Config.BYPASS_CACHE:
+        try:
+            catalogue = SpellCatalogue.load(path)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            pass
+        else:
+            if catalogue.age() <= Config.CACHE_TTL:
+                return catalogue
+    catalogue = SpellCatalogue.build()
+    catalogue.save(path)
+    return catalogue
@@ -0,0 +1,83 @@
+from bs4.element import (
+    NavigableString,
+    PreformattedString,
+    Script,
+    Stylesheet,
+    Tag,
+    TemplateString,
+)
+
+from dnd5e_card_generator.profiling import profiled
+
+IGNORED_STRINGS = (PreformattedString, Script, Stylesheet, TemplateString)
+
+
+class TextExtractor:
+    """Extract the text fragments of a tag, in a single pass over its tree.
+
+    The formatting tags listed in `unwrapped_tags` do not split the text into
+    fragments. Their content is merged with the surrounding text, and marked
+    for the card formatters:
+    - em: _italic_
+    - strong: *bold*
+    - li: • item (each item being a fragment of its own)
+
+    Any other tag splits the text into several fragments. The unwrapped tags
+    are processed in their listed order: when nested, a tag processed after
+    its parent is rendered as plain text.
+
+    """
+
+    markers = {"em": "_{}_", "strong": "*{}*", "li": "• {}"}
+
+    def __init__(self, unwrapped_tags: list[str]):
+        self.order = {name: i for i, name in enumerate(unwrapped_tags)}
+
+    @profiled("extract_text")
+    def extract(self, tag: Tag) -> list[str]:
+        fragments: list[str] = []
+        buffer: list[str] = []
+        self._walk(tag, fragments, buffer)
+        self._flush(fragments, buffer)
+        return fragments
+
+    def render(self, tag: Tag) -> str:
+        """Render an unwrapped tag as a string, along with its marker"""
+        text = self._render_content(tag, self.order[tag.name])
+        if marker := self.markers.get(tag.name):
+            return marker.format(text)
+        return text
+
+    def _render_content(self, tag: Tag, max_order: int) -> str:
+        parts = []
+        for child in tag.children:
+            if isinstance(child, NavigableString):
+                if not isinstance(child, IGNORED_STRINGS):
+                    parts.append(str(child))
+            elif self.order.get(child.name, max_order) < max_order:
+                parts.append(self.render(child))
+            else:
+                parts.append(self._render_content(child, max_order))
+        return "".join(parts)
+
+    def _flush(self, fragments: list[str], buffer: list[str]):
+        if text := "".join(buffer):
+            fragments.append(text)
+        buffer.clear()
+
+    def _walk(self, tag: Tag, fragments: list[str], buffer: list[str]):
+        for child in tag.children:
+            if isinstance(child, NavigableString):
+                if not isinstance(child, IGNORED_STRINGS):
+                    buffer.append(str(child))
+            elif child.name == "li" and "li" in self.order:
+                self._flush(fragments, buffer)
+                fragments.append(self.render(child))
+            elif child.name in self.markers and child.name in self.order:
+                buffer.append(self.render(child))
+            elif child.name in self.order:
+                self._walk(child, fragments, buffer)
+            else:
+                self._flush(fragments, buffer)
+                self._walk(child, fragments, buffer)
+                self._flush(fragments, buffer)